@@ -0,0 +1,524 @@
+"""
+Benchmark suite
+Runs offline on CPU against a generated screenshot corpus and writes the
+results as JSON, so runs before and after a change can be compared
+
+    python benchmark.py --out results.json
+    python benchmark.py --model real --images 500 --only scan,classify
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import platform
+import tempfile
+import argparse
+import subprocess
+import contextlib
+from datetime import datetime, timedelta
+import numpy as np
+from PIL import Image, ImageDraw
+
+import server
+from library import stable_id
+from dedup import PerceptualIndex
+from embedding_store import EmbeddingStore
+from metrics import STAGE_SECONDS
+
+CLASSIFY_STAGES = ("read", "decode", "preprocess", "hash", "prefilter", "forward", "scoring")  # Labels of metrics.STAGE_SECONDS
+CATEGORIES = ["rpg", "action", "scifi", "landscape", "racing", "horror", "sports", "strategy"]
+
+
+# Synthetic corpus
+
+def make_corpus(directory: str, count: int, resolutions: list, formats: list,
+                duplicate_fraction: float = 0.1, seed: int = 0) -> list:
+    """
+    Generate count screenshots spread over per-game subfolders, reusing a
+    previous corpus with the same parameters. A duplicate_fraction of images
+    are near-copies of the one before, like burst captures
+    """
+    params = {
+        "count": count, "resolutions": resolutions, "formats": formats,
+        "duplicateFraction": duplicate_fraction, "seed": seed
+    }
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["params"] == params:
+            return manifest["files"]
+        shutil.rmtree(directory)
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    files = []
+    shapes = None
+
+    for i in range(count):
+        width, height = resolutions[i % len(resolutions)]
+        image_format = formats[i % len(formats)]
+
+        if shapes is None or rng.random() >= duplicate_fraction:
+            shapes = [
+                (rng.random(), rng.random(), rng.random() * 0.4, rng.random() * 0.4,
+                 tuple(rng.randrange(256) for _ in range(3)))
+                for _ in range(rng.randrange(8, 24))
+            ]
+        else:
+            # Burst: same scene, one element nudged
+            x, y, w, h, color = shapes[0]
+            shapes = [(x + 0.01, y, w, h, color)] + shapes[1:]
+
+        top = tuple(rng.randrange(256) for _ in range(3))
+        image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        image = Image.blend(image, Image.new("RGB", (width, height), top), 0.6)
+        draw = ImageDraw.Draw(image)
+        for x, y, w, h, color in shapes:
+            left, upper = int(x * width), int(y * height)
+            draw.rectangle([left, upper, left + int(w * width), upper + int(h * height)], fill=color)
+
+        folder = os.path.join(directory, f"game_{i % 10:02d}")
+        os.makedirs(folder, exist_ok=True)
+        extension = "jpg" if image_format == "jpeg" else image_format
+        path = os.path.join(folder, f"screenshot_{i:06d}.{extension}")
+        image.save(path, format="JPEG" if extension == "jpg" else extension.upper(), quality=90)
+        files.append(path)
+
+    with open(manifest_path, "w") as f:
+        json.dump({"params": params, "files": files}, f)
+    return files
+
+
+def synthetic_records(count: int, root: str = "/library", seed: int = 0) -> list:
+    """Gallery records shaped like build_result() output, without any files behind them"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    records = []
+    for i in range(count):
+        path = os.path.join(root, f"game_{i % 50:02d}", f"screenshot_{i:07d}.png")
+        screenshot_id = stable_id(path)
+        category = CATEGORIES[i % len(CATEGORIES)]
+        game_score = 0.5 + rng.random() * 0.49
+        records.append({
+            "id": screenshot_id,
+            "url": f"/screenshots/{screenshot_id}?v={i:016x}",
+            "folder": f"game_{i % 50:02d}",
+            "fileName": os.path.basename(path),
+            "filePath": path,
+            "title": f"Screenshot {i}",
+            "game": "Video Game",
+            "category": category,
+            "confidence": game_score,
+            "isGameScreenshot": True,
+            "gameScore": game_score,
+            "nonGameScore": 1 - game_score,
+            "animeScore": rng.random() * 0.1,
+            "codeScore": rng.random() * 0.1,
+            "topPredictions": [
+                {"label": "a screenshot from a video game", "confidence": rng.random()}
+                for _ in range(5)
+            ],
+            "resolution": "2560x1440",
+            "contentHash": hashlib.blake2b(path.encode(), digest_size=16).hexdigest(),
+            "perceptualHash": f"{rng.getrandbits(64):016x}",
+            "duplicateOf": None,
+            "dateAdded": (start + timedelta(seconds=i * 37)).isoformat(),
+            "fileSize": rng.randrange(200_000, 8_000_000),
+            "thumbnails": {
+                "320": f"/thumbnails/{screenshot_id}?w=320&v=0123456789ab",
+                "640": f"/thumbnails/{screenshot_id}?w=640&v=0123456789ab"
+            },
+            "thumbnailUrl": f"/thumbnails/{screenshot_id}?w=320&v=0123456789ab"
+        })
+    return records
+
+
+# Classifiers
+
+class StubBackend:
+    """Deterministic stand-in for the vision encoder: pooled pixels times a fixed projection"""
+
+    def __init__(self, dim: int, seed: int = 0):
+        import torch
+        self.torch = torch
+        generator = torch.Generator().manual_seed(seed)
+        self.projection = torch.randn(3 * 8 * 8, dim, generator=generator)
+
+    def encode(self, pixel_values):
+        pooled = self.torch.nn.functional.adaptive_avg_pool2d(pixel_values.float(), 8)
+        return pooled.flatten(1) @ self.projection
+
+
+def make_stub_classifier(dim: int = 512, **kwargs):
+    """
+    GameScreenshotClassifier with the CLIP weights swapped for random prompt
+    embeddings and StubBackend; decode, preprocessing, dedup and scoring are the real code
+    """
+    import torch
+    from transformers import CLIPImageProcessor
+    from classifier import GameScreenshotClassifier
+
+    class StubClassifier(GameScreenshotClassifier):
+        def initialize(self):
+            generator = torch.Generator().manual_seed(1)
+            self.processor = CLIPImageProcessor()
+            self.device = "cpu"
+            self.category_embeddings = self._random_embeddings(len(self.categories), generator)
+            self.subcategory_embeddings = self._random_embeddings(len(self.game_subcategories), generator)
+            self.embedding_dim = dim
+            self.backend = StubBackend(dim)
+            self.initialized = True
+
+        def _random_embeddings(self, count, generator):
+            embeds = torch.randn(count, dim, generator=generator)
+            return embeds / embeds.norm(dim=-1, keepdim=True)
+
+        def encode_text(self, text: str) -> np.ndarray:
+            generator = torch.Generator().manual_seed(int(hashlib.md5(text.encode()).hexdigest()[:8], 16))
+            return self._random_embeddings(1, generator)[0].numpy()
+
+    return StubClassifier(**kwargs)
+
+
+def make_classifier(kind: str):
+    kwargs = {
+        "decode_workers": server.CONFIG["DECODE_WORKERS"],
+        "queue_size": server.CONFIG["DECODE_QUEUE_SIZE"]
+    }
+    if kind == "stub":
+        model = make_stub_classifier(**kwargs)
+    else:
+        # Only use weights already in the local Hugging Face cache
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        from classifier import GameScreenshotClassifier
+        model = GameScreenshotClassifier(backend=server.CONFIG["INFERENCE_BACKEND"], **kwargs)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.initialize()
+    return model
+
+
+# Measurement helpers
+
+def summarize(samples: list) -> dict:
+    """Latency statistics in milliseconds"""
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "meanMs": round(float(values.mean()), 3),
+        "p50Ms": round(float(np.percentile(values, 50)), 3),
+        "p95Ms": round(float(np.percentile(values, 95)), 3),
+        "minMs": round(float(values.min()), 3),
+        "maxMs": round(float(values.max()), 3)
+    }
+
+
+def timed(fn, *args, **kwargs) -> tuple:
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+@contextlib.contextmanager
+def quiet():
+    """The server's progress output would dominate the timing of small runs"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def reset_server(workdir: str, roots: list = None):
+    """Point the server at scratch paths and drop all in-memory state"""
+    server.CONFIG.update(
+        LIBRARY_ROOTS=roots or [],
+        CACHE_DB=os.path.join(workdir, "cache.db"),
+        CACHE_FILE=os.path.join(workdir, "cache.json"),
+        EMBEDDINGS_DIR=os.path.join(workdir, "embeddings")
+    )
+    if server.cache_store is not None:
+        server.cache_store.close()
+    server.cache_store = None
+    server.classification_cache = {}
+    server.file_index = {}
+    server.gallery.replace_all([])
+
+
+def install_classifier(model):
+    """What load_model() does, with an already-initialized classifier"""
+    server.embedding_store = EmbeddingStore(server.CONFIG["EMBEDDINGS_DIR"], model.embedding_dim)
+    model.embedding_store = server.embedding_store
+    server.duplicate_index = PerceptualIndex(max_distance=server.CONFIG["DUPLICATE_HASH_DISTANCE"])
+    model.duplicate_index = server.duplicate_index
+    server.classifier = model
+
+
+# Benchmarks
+
+def bench_scan(workdir: str, files: list, corpus_dir: str, model_kind: str) -> dict:
+    """scan_existing_files from nothing, after a restart, with nothing changed, and with only embeddings kept"""
+    scan_dir = os.path.join(workdir, "scan")
+    shutil.rmtree(scan_dir, ignore_errors=True)
+    os.makedirs(scan_dir)
+    reset_server(scan_dir, [corpus_dir])
+    model = make_classifier(model_kind)
+    results = {}
+
+    def run(name):
+        seconds, counters = timed(server.scan_existing_files)
+        results[name] = {
+            "seconds": round(seconds, 4),
+            "filesPerSecond": round(len(files) / seconds, 1),
+            "processed": counters.get("processed"),
+            "games": counters.get("games")
+        }
+
+    with quiet():
+        server.load_cache()
+        install_classifier(model)
+        run("cold")
+
+        # Restart: cache on disk, empty memory
+        reset_server(scan_dir, [corpus_dir])
+        server.load_cache()
+        install_classifier(model)
+        run("warmRestart")
+
+        # Second scan in the same process: nothing changed on disk
+        run("noChanges")
+
+        # Cache cleared but embeddings kept: decode and hash only, no model
+        server.cache_store.clear()
+        reset_server(scan_dir, [corpus_dir])
+        server.load_cache()
+        install_classifier(model)
+        run("embeddingsOnly")
+
+    reset_server(scan_dir)
+    server.classifier = None
+    return results
+
+
+def bench_cache(workdir: str, sizes: list, backends: list) -> dict:
+    """save_cache/load_cache time (and restore_gallery) against cache size"""
+    results = {}
+    for backend in backends:
+        for size in sizes:
+            cache_dir = os.path.join(workdir, f"cache_{backend}_{size}")
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            os.makedirs(cache_dir)
+            server.CONFIG["CACHE_BACKEND"] = backend
+            reset_server(cache_dir, ["/library"])
+            records = synthetic_records(size)
+            keys = [f"{r['filePath']}_{1_700_000_000_000_000_000 + i}" for i, r in enumerate(records)]
+
+            with quiet():
+                server.load_cache()
+                start = time.perf_counter()
+                for key, record in zip(keys, records):
+                    server.cache_put(key, record)
+                put_seconds = time.perf_counter() - start
+                save_seconds, _ = timed(server.save_cache)
+
+                reset_server(cache_dir, ["/library"])
+                load_seconds, _ = timed(server.load_cache)
+                restore_seconds, restored = timed(server.restore_gallery)
+
+            path = server.CONFIG["CACHE_FILE"] if backend == "json" else server.CONFIG["CACHE_DB"]
+            results[f"{backend}/{size}"] = {
+                "backend": backend,
+                "records": size,
+                "putSeconds": round(put_seconds, 4),
+                "saveSeconds": round(save_seconds, 4),
+                "loadSeconds": round(load_seconds, 4),
+                "restoreGallerySeconds": round(restore_seconds, 4),
+                "restored": restored,
+                "bytesOnDisk": os.path.getsize(path) if os.path.exists(path) else None
+            }
+            reset_server(cache_dir)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    server.CONFIG["CACHE_BACKEND"] = "sqlite"
+    return results
+
+
+def bench_classify(files: list, model_kind: str, limit: int) -> dict:
+    """
+    Per-image latency of classify_image, and of batched classify_images,
+    with the time spent in each stage read back from the stage histograms
+    """
+    model = make_classifier(model_kind)
+    paths = files[:limit]
+
+    def run(fn):
+        before = {stage: STAGE_SECONDS.totals(stage=stage) for stage in CLASSIFY_STAGES}
+        seconds, _ = timed(fn)
+        stages = {}
+        for stage in CLASSIFY_STAGES:
+            total, count = STAGE_SECONDS.totals(stage=stage)
+            total, count = total - before[stage][0], count - before[stage][1]
+            if count:
+                stages[stage] = {
+                    "count": count,
+                    "meanMs": round(total / count * 1000, 3),
+                    "msPerImage": round(total / len(paths) * 1000, 3)
+                }
+        return seconds, stages
+
+    samples = []
+
+    def single():
+        for path in paths:
+            seconds, _ = timed(model.classify_image, path)
+            samples.append(seconds)
+
+    _, single_stages = run(single)
+    # The threaded pipeline, as scans and ingest use it
+    batched_seconds, batched_stages = run(
+        lambda: model.classify_images(paths, batch_size=server.CONFIG["BATCH_SIZE"])
+    )
+
+    return {
+        "images": len(paths),
+        "latency": summarize(samples),
+        "stages": single_stages,
+        "batchedStages": batched_stages,
+        "batchedImagesPerSecond": round(len(paths) / batched_seconds, 1)
+    }
+
+
+def bench_api(sizes: list, repeats: int) -> dict:
+    """
+    /api/screenshots latency and payload size against gallery size
+    Repeated requests are served from the response cache; *Cold entries clear it first
+    """
+    client = server.app.test_client()
+    results = {}
+
+    for size in sizes:
+        records = synthetic_records(size)
+        server.gallery.replace_all(records)
+        middle = server.encode_cursor(server.gallery.page()[size // 2])
+
+        requests = {
+            "firstPage": ("/api/screenshots?limit=60", repeats, False),
+            "firstPageCold": ("/api/screenshots?limit=60", repeats, True),
+            "firstPageProjected": ("/api/screenshots?limit=60&fields=id,url,thumbnailUrl,title,game,category,dateAdded", repeats, False),
+            "categoryPage": ("/api/screenshots?category=rpg&limit=60", repeats, False),
+            "deepPage": (f"/api/screenshots?limit=60&cursor={middle}", repeats, False),
+            "full": ("/api/screenshots", max(1, repeats // 10), False),
+            "fullCold": ("/api/screenshots", max(1, repeats // 10), True)
+        }
+
+        size_results = {}
+        for name, (url, count, cold) in requests.items():
+            samples = []
+            payload = 0
+            if not cold:
+                client.get(url)  # Warm the response cache
+            for _ in range(count):
+                if cold:
+                    server.response_cache.clear()
+                seconds, response = timed(client.get, url)
+                samples.append(seconds)
+                payload = len(response.data)
+            size_results[name] = {**summarize(samples), "payloadBytes": payload}
+        results[str(size)] = size_results
+
+    server.gallery.replace_all([])
+    return results
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    torch = sys.modules.get("torch")
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpuCount": os.cpu_count(),
+        "torch": torch.__version__ if torch else None,
+        "torchThreads": torch.get_num_threads() if torch else None
+    }
+
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def parse_resolution(value: str) -> tuple:
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scan, cache, classifier and API hot paths")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "screenshot-gallery-bench"),
+                        help="Corpus and scratch files; the corpus is reused between runs")
+    parser.add_argument("--only", default="scan,cache,classify,api", help="Comma-separated benchmarks to run")
+    parser.add_argument("--model", choices=("stub", "real"), default="stub",
+                        help="stub needs no weights; real uses CLIP from the local Hugging Face cache")
+    parser.add_argument("--images", type=int, default=200, help="Synthetic corpus size")
+    parser.add_argument("--resolutions", default="1920x1080,2560x1440,3840x2160")
+    parser.add_argument("--formats", default="png,jpg,webp")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="Fraction of burst near-duplicates")
+    parser.add_argument("--classify-images", type=int, default=50, help="Images timed per classify stage")
+    parser.add_argument("--cache-sizes", default="1000,10000,100000")
+    parser.add_argument("--cache-backends", default="sqlite,json")
+    parser.add_argument("--api-sizes", default="1000,10000,100000")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    only = set(parse_list(args.only))
+    os.makedirs(args.workdir, exist_ok=True)
+    server.thumbnail_service = None
+    report = {"environment": None, "config": vars(args), "results": {}}
+
+    files = []
+    corpus_dir = os.path.join(args.workdir, "corpus")
+    if only & {"scan", "classify"}:
+        print(f"🖼️ Preparing {args.images} synthetic screenshots in {corpus_dir}...")
+        files = make_corpus(
+            corpus_dir,
+            args.images,
+            parse_list(args.resolutions, parse_resolution),
+            parse_list(args.formats),
+            duplicate_fraction=args.duplicates,
+            seed=args.seed
+        )
+        report["corpus"] = {"images": len(files), "bytes": sum(os.path.getsize(path) for path in files)}
+
+    benchmarks = [
+        ("scan", lambda: bench_scan(args.workdir, files, corpus_dir, args.model)),
+        ("cache", lambda: bench_cache(args.workdir, parse_list(args.cache_sizes, int), parse_list(args.cache_backends))),
+        ("classify", lambda: bench_classify(files, args.model, args.classify_images)),
+        ("api", lambda: bench_api(parse_list(args.api_sizes, int), args.repeats))
+    ]
+    for name, run in benchmarks:
+        if name in only:
+            print(f"⏱️ Running {name} benchmark...")
+            report["results"][name] = run()
+
+    report["environment"] = environment()
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
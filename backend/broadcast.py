@@ -0,0 +1,166 @@
+"""
+Change broadcasting
+Gallery changes are coalesced over a short window and sent to clients as
+one screenshotsChanged event of slim records, however many files an ingest
+burst or a bulk copy touches. Clients acknowledge each batch; one that
+falls too far behind stops receiving batches and is told to resync once
+it catches up, rather than having an ever longer queue built up for it
+"""
+
+import time
+import threading
+import metrics
+
+LIVE_ROOM = "live"  # Clients in good standing; batches go to this room, encoded once
+
+BROADCAST_BATCHES = metrics.Counter(
+    "screenshot_broadcast_batches_total",
+    "screenshotsChanged events sent, by whether they carried the changes or only a resync marker",
+    labels=("kind",)
+)
+BROADCAST_DEMOTIONS = metrics.Counter(
+    "screenshot_broadcast_demotions_total",
+    "Clients taken off live updates for not acknowledging batches"
+)
+
+
+class ChangeBroadcaster:
+    """
+    publish() is called for every changelog entry; a background thread sends
+    what accumulated at most once per window. Changes to one id within a
+    window collapse to the last. A batch with more than max_changes changes
+    is sent as a marker only, and clients fetch /api/screenshots/changes
+    """
+
+    def __init__(self, socketio, epoch: str, window: float = 0.25, max_changes: int = 200,
+                 max_unacked: int = 8, fields: list = None, namespace: str = "/"):
+        self.socketio = socketio
+        self.epoch = epoch
+        self.window = window
+        self.max_changes = max_changes
+        self.max_unacked = max_unacked  # Batches a client may be behind before it is taken off live updates
+        self.fields = fields  # Projection of each record; None sends whole records
+        self.namespace = namespace
+        self.condition = threading.Condition()
+        self.pending = {}  # id -> (seq, op, record), last change per id
+        self.from_seq = None  # Sequence number the pending changes follow on from
+        self.seq = 0
+        self.batch = 0
+        self.clients = {}  # sid -> {"acked": last batch acknowledged, "live": bool, "sent": last batch sent}
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="change-broadcast", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def publish(self, seq: int, op: str, record):
+        with self.condition:
+            if self.from_seq is None:
+                self.from_seq = seq - 1
+            self.seq = seq
+            previous = self.pending.get(record["id"])
+            if previous is not None and previous[1] == "add":
+                if op == "remove":
+                    # Added and removed within one window: clients never need to hear of it
+                    del self.pending[record["id"]]
+                    self.condition.notify()
+                    return
+                op = "add"
+            elif previous is not None and previous[1] == "remove" and op == "add":
+                op = "update"
+            self.pending[record["id"]] = (seq, op, record)
+            self.condition.notify()
+
+    def connect(self, sid: str):
+        with self.condition:
+            self.clients[sid] = {"acked": self.batch, "live": True, "sent": self.batch}
+        self.socketio.server.enter_room(sid, LIVE_ROOM, namespace=self.namespace)
+
+    def disconnect(self, sid: str):
+        with self.condition:
+            self.clients.pop(sid, None)
+
+    def ack(self, sid: str, batch: int):
+        """A client has applied batch; one that was taken off live updates rejoins with a resync"""
+        with self.condition:
+            client = self.clients.get(sid)
+            if client is None or not isinstance(batch, int):
+                return
+            client["acked"] = max(client["acked"], batch)
+            if client["live"] or client["acked"] < client["sent"]:
+                return
+            # It has drained everything it was sent; catch it up in one request
+            client["live"] = True
+            client["acked"] = client["sent"] = self.batch
+            target = {"seq": self.seq, "epoch": self.epoch}
+        self.socketio.server.enter_room(sid, LIVE_ROOM, namespace=self.namespace)
+        self.socketio.emit("refresh", target, to=sid, namespace=self.namespace)
+
+    def stats(self) -> dict:
+        with self.condition:
+            live = sum(1 for client in self.clients.values() if client["live"])
+            return {"batches": self.batch, "clients": len(self.clients), "live": live, "resyncing": len(self.clients) - live}
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.from_seq is None and not self.closed:
+                    self.condition.wait()
+                # Let the rest of a burst arrive; this is the rate limit
+                deadline = time.monotonic() + self.window
+                while not self.closed and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+                if self.closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Send what accumulated as one batch, first taking lagging clients off live updates"""
+        with self.condition:
+            if self.from_seq is None:
+                return
+            changes = sorted(self.pending.values(), key=lambda change: change[0])
+            batch = {"epoch": self.epoch, "fromSeq": self.from_seq, "seq": self.seq}
+            self.pending = {}
+            self.from_seq = None
+            self.batch += 1
+            batch["batch"] = self.batch
+
+            demoted = []
+            for sid, client in self.clients.items():
+                if client["live"] and self.batch - 1 - client["acked"] >= self.max_unacked:
+                    client["live"] = False
+                    client["sent"] = self.batch - 1
+                    demoted.append(sid)
+                elif client["live"]:
+                    client["sent"] = self.batch
+
+        for sid in demoted:
+            self.socketio.server.leave_room(sid, LIVE_ROOM, namespace=self.namespace)
+            BROADCAST_DEMOTIONS.inc()
+        if demoted:
+            print(f"🐢 {len(demoted)} client(s) behind on updates; they will resync once caught up")
+
+        if len(changes) > self.max_changes:
+            batch["truncated"] = True
+            batch["changes"] = []
+            BROADCAST_BATCHES.inc(kind="truncated")
+        else:
+            batch["truncated"] = False
+            batch["changes"] = [self._payload(*change) for change in changes]
+            BROADCAST_BATCHES.inc(kind="changes")
+        self.socketio.emit("screenshotsChanged", batch, to=LIVE_ROOM, namespace=self.namespace)
+
+    def _payload(self, seq: int, op: str, record) -> dict:
+        payload = {"seq": seq, "op": op, "id": record["id"]}
+        if op != "remove":
+            if self.fields:
+                payload["screenshot"] = {f: record[f] for f in self.fields if f in record}
+            else:
+                payload["screenshot"] = record.to_dict() if hasattr(record, "to_dict") else dict(record)
+        return payload
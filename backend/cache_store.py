@@ -0,0 +1,188 @@
+"""
+Classification cache storage
+Persists classification results keyed by get_cache_key() with per-entry
+upserts and batched commits, so writes stay cheap as the cache grows
+"""
+
+import os
+import json
+import sqlite3
+import threading
+
+
+class CacheStore:
+    """
+    Base interface for cache backends
+    put()/delete() stage changes; commit() makes them durable
+    """
+
+    def load_all(self) -> dict:
+        raise NotImplementedError
+
+    def put(self, key: str, value: dict):
+        raise NotImplementedError
+
+    def put_many(self, items: dict):
+        for key, value in items.items():
+            self.put(key, value)
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def commit(self):
+        raise NotImplementedError
+
+    def close(self):
+        self.commit()
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class SQLiteCacheStore(CacheStore):
+    """SQLite in WAL mode: atomic upserts, readers never see a half-written cache"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        # Shared by the watchdog thread and Flask handlers, guarded by self.lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS classifications ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def load_all(self) -> dict:
+        with self.lock:
+            rows = self.conn.execute("SELECT key, value FROM classifications").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def put(self, key: str, value: dict):
+        data = json.dumps(value, separators=(",", ":"))
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO classifications (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, data)
+            )
+
+    def put_many(self, items: dict):
+        rows = [(key, json.dumps(value, separators=(",", ":"))) for key, value in items.items()]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO classifications (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                rows
+            )
+
+    def delete(self, key: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM classifications WHERE key = ?", (key,))
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM classifications")
+            self.conn.commit()
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+
+
+class JSONCacheStore(CacheStore):
+    """
+    The original single-file JSON cache
+    Writes the whole file on commit, via a temp file so a crash can't corrupt it
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {}
+        self.dirty = False
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.data = json.load(f)
+
+    def load_all(self) -> dict:
+        with self.lock:
+            return dict(self.data)
+
+    def put(self, key: str, value: dict):
+        with self.lock:
+            self.data[key] = value
+            self.dirty = True
+
+    def put_many(self, items: dict):
+        with self.lock:
+            self.data.update(items)
+            self.dirty = True
+
+    def delete(self, key: str):
+        with self.lock:
+            if self.data.pop(key, None) is not None:
+                self.dirty = True
+
+    def clear(self):
+        with self.lock:
+            self.data = {}
+            self.dirty = True
+        self.commit()
+
+    def commit(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+CACHE_BACKENDS = {
+    "sqlite": SQLiteCacheStore,
+    "json": JSONCacheStore,
+}
+
+
+def open_cache_store(backend: str, path: str) -> CacheStore:
+    """Create the configured cache backend"""
+    if backend not in CACHE_BACKENDS:
+        raise ValueError(f"Unknown cache backend: {backend}")
+    return CACHE_BACKENDS[backend](path)
+
+
+def migrate_json_cache(store: CacheStore, json_path: str) -> int:
+    """
+    One-time import of a legacy classification_cache.json into store
+    The JSON file is renamed afterwards so the import never runs twice
+    """
+    if not os.path.exists(json_path) or os.path.abspath(json_path) == os.path.abspath(store.path):
+        return 0
+
+    with open(json_path, "r") as f:
+        legacy = json.load(f)
+
+    store.put_many(legacy)
+    store.commit()
+    os.replace(json_path, f"{json_path}.migrated")
+    return len(legacy)
@@ -4,17 +4,62 @@ Uses OpenAI's CLIP model to classify images based on natural language descriptio
 """
 
 import torch
+import numpy as np
 from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
 import os
+from collections import deque
+from concurrent.futures import Future
+from pipeline import DecodePipeline
+from prefilter import Prefilter, image_features
+from dedup import hamming_distances
+from inference import configure_threads, create_backend
+from metrics import STAGE_SECONDS, MODEL_IMAGES, FALLBACKS
 
 class GameScreenshotClassifier:
-    def __init__(self):
+    def __init__(self, decode_workers: int = 4, queue_size: int = 64, backend: str = "fp32",
+                 threads: int = None, interop_threads: int = None, model_cache_dir: str = "models",
+                 workers: int = 0, worker_batch_size: int = 16,
+                 prefilter_cutoff: float = None, prefilter_audit_rate: float = 0.05):
         self.model = None
         self.processor = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.initialized = False
         
+        # Vision encoder backend (see inference.py); the text encoder always runs eagerly
+        self.backend_name = backend
+        self.backend = None
+        self.threads = threads
+        self.interop_threads = interop_threads
+        self.model_cache_dir = model_cache_dir
+        
+        # workers > 0 runs the vision encoder in that many processes (see inference_pool.py)
+        self.workers = workers
+        self.worker_batch_size = worker_batch_size
+        
+        # Normalized prompt embeddings, computed once in initialize()
+        self.category_embeddings = None
+        self.subcategory_embeddings = None
+        self.logit_scale = 100.0
+        self.embedding_dim = None
+        
+        # Optional first tier of a cascade (see prefilter.py); None sends every image to the model
+        self.prefilter = None
+        if prefilter_cutoff is not None:
+            self.prefilter = Prefilter(reject_cutoff=prefilter_cutoff, audit_rate=prefilter_audit_rate)
+        
+        # Threaded read/decode/preprocess stage feeding batched inference
+        self.pipeline = DecodePipeline(
+            self._preprocess, workers=decode_workers, queue_size=queue_size,
+            analyze=image_features if self.prefilter is not None else None
+        )
+        
+        # Optional EmbeddingStore; when set, image embeddings are persisted and reused
+        self.embedding_store = None
+        
+        # Optional PerceptualIndex; near-identical images reuse a stored embedding
+        self.duplicate_index = None
+        
         # Categories to classify against
         self.categories = [
             # Game categories (positive)
@@ -55,17 +100,92 @@ class GameScreenshotClassifier:
         print("🤖 Loading CLIP model (this may take a moment on first run)...")
         
         try:
+            configure_threads(self.threads, self.interop_threads)
             self.model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
             self.processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
             self.model.to(self.device)
             self.model.eval()
+            self._build_text_embeddings()
+            self.embedding_dim = self.model.config.projection_dim
+            if self.workers > 0:
+                self.backend = self._start_pool()
+            else:
+                self.backend = create_backend(
+                    self.backend_name,
+                    self.model,
+                    self.device,
+                    threads=self.threads,
+                    interop_threads=self.interop_threads,
+                    cache_dir=self.model_cache_dir
+                )
             self.initialized = True
-            print(f"✅ CLIP model loaded successfully on {self.device.upper()}")
+            if self.workers > 0:
+                print(f"✅ CLIP model loaded successfully ({self.backend_name} backend in {self.workers} worker processes)")
+            else:
+                print(f"✅ CLIP model loaded successfully on {self.device.upper()} ({self.backend_name} backend, {torch.get_num_threads()} threads)")
             
         except Exception as e:
             print(f"❌ Failed to load CLIP model: {e}")
             raise e
     
+    def _start_pool(self):
+        """Worker processes for the vision encoder; this process keeps the text side"""
+        from inference_pool import InferencePool
+        
+        # Split the cores between workers unless told otherwise, so they don't oversubscribe
+        threads = self.threads or max(1, (os.cpu_count() or 1) // self.workers)
+        pool = InferencePool(
+            self.workers,
+            image_size=self.model.config.vision_config.image_size,
+            embedding_dim=self.embedding_dim,
+            batch_size=self.worker_batch_size,
+            options={
+                "backend": self.backend_name,
+                "threads": threads,
+                "interop_threads": self.interop_threads,
+                "model_cache_dir": self.model_cache_dir
+            }
+        )
+        pool.start()
+        return pool
+    
+    def _build_text_embeddings(self):
+        """
+        Encode every prompt once so the hot path only runs the vision encoder.
+        Call again after editing categories or game_subcategories.
+        """
+        self.category_embeddings = self._encode_texts(self.categories)
+        self.subcategory_embeddings = self._encode_texts(list(self.game_subcategories.values()))
+        self.logit_scale = float(self.model.logit_scale.exp().item())
+    
+    def _encode_texts(self, texts: list) -> torch.Tensor:
+        """Return L2-normalized text embeddings, one row per prompt"""
+        inputs = self.processor(text=texts, return_tensors="pt", padding=True)
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        
+        with torch.no_grad():
+            pooled = self.model.text_model(**inputs).pooler_output
+            embeds = self.model.text_projection(pooled)
+        
+        return embeds / embeds.norm(dim=-1, keepdim=True)
+    
+    def encode_text(self, text: str) -> np.ndarray:
+        """Normalized embedding for a free-text query, comparable to image embeddings"""
+        if not self.initialized:
+            raise RuntimeError("Classifier not initialized. Call initialize() first.")
+        return self._encode_texts([text])[0].float().cpu().numpy()
+    
+    def _preprocess(self, image: Image.Image) -> torch.Tensor:
+        """Resize, crop and normalize a decoded image into a pixel tensor"""
+        return self.processor(images=image, return_tensors="pt")["pixel_values"][0]
+    
+    def _encode_images(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """Return L2-normalized image embeddings, one row per image"""
+        with STAGE_SECONDS.time(stage="forward"):
+            embeds = self.backend.encode(pixel_values).float().to(self.device)
+        MODEL_IMAGES.inc(len(pixel_values))
+        return embeds / embeds.norm(dim=-1, keepdim=True)
+    
     def classify_image(self, image_path: str) -> dict:
         """
         Classify an image to determine if it's a game screenshot
@@ -74,100 +194,292 @@ class GameScreenshotClassifier:
         if not self.initialized:
             raise RuntimeError("Classifier not initialized. Call initialize() first.")
         
+        # Load at reduced resolution, keeping the original size for the aspect ratio check
+        item = self.pipeline.decode(0, image_path)
+        return self._classify_decoded([item])[0]
+    
+    def classify_images(self, image_paths: list, batch_size: int = 16) -> list:
+        """
+        Classify many images, running the vision encoder once per batch
+        Returns one result dict per path, in the same order as image_paths
+        """
+        if not self.initialized:
+            raise RuntimeError("Classifier not initialized. Call initialize() first.")
+        
+        results = [None] * len(image_paths)
+        
+        # Decoding for the next batch continues on the pipeline threads while this one runs;
+        # with a worker pool, up to one batch per worker is encoding at a time
+        depth = self.workers or 1
+        in_flight = deque()
+        
+        def collect():
+            batch, state = in_flight.popleft()
+            for item, result in zip(batch, self._finish_batch(batch, state)):
+                results[item.index] = result
+        
+        for batch in self.pipeline.batches(image_paths, batch_size):
+            in_flight.append((batch, self._start_batch(batch)))
+            if len(in_flight) >= depth:
+                collect()
+        while in_flight:
+            collect()
+        
+        return results
+    
+    def _classify_decoded(self, items: list) -> list:
+        """Classify DecodedImage items, returning results in the same order"""
+        return self._finish_batch(items, self._start_batch(items))
+    
+    def _submit_encode(self, pixel_values: torch.Tensor) -> Future:
+        """_encode_images on the worker pool's dispatch threads, or right here without a pool"""
+        if self.workers > 0:
+            return self.backend.submit(self._encode_images, pixel_values)
+        future = Future()
         try:
-            # Load and preprocess image
-            image = Image.open(image_path).convert("RGB")
-            
-            # Get image dimensions for aspect ratio check
-            width, height = image.size
-            aspect_ratio = width / height
-            
-            # Process image with all categories
-            inputs = self.processor(
-                text=self.categories,
-                images=image,
-                return_tensors="pt",
-                padding=True
-            )
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            # Get predictions
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                logits = outputs.logits_per_image
-                probs = logits.softmax(dim=1).cpu().numpy()[0]
-            
-            # Calculate game vs non-game scores
-            # First 4 categories are game-related, rest are non-game
-            game_score = float(sum(probs[:4]))
-            non_game_score = float(sum(probs[4:]))
-            
-            # Get top predictions
-            top_indices = probs.argsort()[::-1][:5]
-            top_predictions = [
-                {"label": self.categories[i], "confidence": float(probs[i])}
-                for i in top_indices
-            ]
-            
-            # Determine if it's a game screenshot
-            # Be strict: game score must be significantly higher
-            is_game_screenshot = game_score > non_game_score * 1.5 and game_score > 0.3
-            
-            # Additional checks for common false positives
-            anime_score = float(probs[6]) + float(probs[7])  # anime + hentai
-            code_score = float(probs[4]) + float(probs[5])   # code + terminal
-            browser_score = float(probs[8])                   # browser
-            
-            # Reject if any non-game category is too high
-            if anime_score > 0.25 or code_score > 0.25 or browser_score > 0.2:
-                is_game_screenshot = False
-            
-            # Get game category if it's a game
-            category = "gaming"
-            detected_game = "Video Game"
-            
-            if is_game_screenshot:
-                category, detected_game = self._get_game_category(image)
+            future.set_result(self._encode_images(pixel_values))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    def _start_batch(self, items: list) -> tuple:
+        """
+        First half of _classify_decoded: reuse stored embeddings, let the
+        pre-filter reject what it can, group in-batch duplicates and start
+        encoding the rest
+        """
+        results = [None] * len(items)
+        embeddings = [None] * len(items)
+        to_encode = []
+        followers = {}  # pos -> pos of a near-identical image earlier in this batch
+        audited = set()  # Pre-filter rejections also sent to the model
+        
+        for pos, item in enumerate(items):
+            if item.error is not None:
+                print(f"❌ Error classifying {item.path}: {item.error}")
+                results[pos] = self._fallback_classification(item.path)
+                continue
             
-            confidence = game_score if is_game_screenshot else non_game_score
+            stored = self._reuse_embedding(item)
+            if stored is not None:
+                embeddings[pos] = torch.from_numpy(stored.astype(np.float32)).to(self.device)
+                continue
             
-            return {
-                "isGameScreenshot": is_game_screenshot,
-                "confidence": min(0.99, max(0.1, confidence)),
-                "gameScore": game_score,
-                "nonGameScore": non_game_score,
-                "animeScore": anime_score,
-                "codeScore": code_score,
-                "detectedGame": detected_game,
-                "category": category,
-                "topPredictions": top_predictions,
-                "aspectRatio": aspect_ratio,
-                "resolution": f"{width}x{height}"
-            }
+            if self.prefilter is not None:
+                score = self.prefilter.decide(item.features)
+                if score is not None:
+                    if not self.prefilter.should_audit(item.content_hash):
+                        results[pos] = self._prefilter_classification(item, score)
+                        self.prefilter.record("prefilter")
+                        continue
+                    audited.add(pos)
             
-        except Exception as e:
-            print(f"❌ Error classifying {image_path}: {e}")
-            return self._fallback_classification(image_path)
+            leader = self._find_in_batch(item, [items[p] for p in to_encode])
+            if leader is not None:
+                followers[pos] = to_encode[leader]
+            else:
+                to_encode.append(pos)
+        
+        encoding = None
+        if to_encode:
+            encoding = self._submit_encode(torch.stack([items[pos].pixel_values for pos in to_encode]))
+        return results, embeddings, to_encode, followers, audited, encoding
     
-    def _get_game_category(self, image: Image.Image) -> tuple:
-        """Determine the game subcategory"""
-        subcategory_texts = list(self.game_subcategories.values())
-        subcategory_keys = list(self.game_subcategories.keys())
+    def _finish_batch(self, items: list, state: tuple) -> list:
+        """Second half of _classify_decoded: wait for the encoder and build the results"""
+        results, embeddings, to_encode, followers, audited, encoding = state
+        
+        if encoding is not None:
+            try:
+                encoded = encoding.result()
+            except Exception as e:
+                print(f"❌ Error classifying batch of {len(to_encode)} images: {e}")
+                for pos in to_encode + list(followers):
+                    results[pos] = self._fallback_classification(items[pos].path)
+                followers = {}
+            else:
+                for pos, embedding in zip(to_encode, encoded):
+                    embeddings[pos] = embedding
+                    if self.duplicate_index is not None:
+                        self.duplicate_index.add(items[pos].phash, items[pos].content_hash)
+                
+                for pos, leader in followers.items():
+                    embeddings[pos] = embeddings[leader]
+                    items[pos].duplicate_of = items[leader].content_hash
+                
+                if self.embedding_store is not None:
+                    stored_positions = to_encode + list(followers)
+                    self.embedding_store.add_many(
+                        [items[pos].content_hash for pos in stored_positions],
+                        torch.stack([embeddings[pos] for pos in stored_positions]).cpu().numpy()
+                    )
         
-        inputs = self.processor(
-            text=subcategory_texts,
-            images=image,
-            return_tensors="pt",
-            padding=True
+        for pos, embedding in enumerate(embeddings):
+            if embedding is None:
+                continue
+            item = items[pos]
+            width, height = item.size
+            results[pos] = self._classify_embedding(embedding, width, height)
+            results[pos]["contentHash"] = item.content_hash
+            results[pos]["perceptualHash"] = f"{item.phash:016x}"
+            if item.duplicate_of:
+                results[pos]["duplicateOf"] = item.duplicate_of
+            if self.prefilter is not None:
+                self.prefilter.record("model")
+                if pos in audited:
+                    self.prefilter.record_audit(results[pos])
+        
+        return results
+    
+    def _find_in_batch(self, item, batch_items: list):
+        """Index into batch_items of a near-identical image, so bursts within one batch encode once"""
+        if self.duplicate_index is None or not batch_items:
+            return None
+        
+        distances = hamming_distances(
+            np.array([other.phash for other in batch_items], dtype=np.uint64),
+            item.phash
         )
-        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        best = int(distances.argmin())
+        return best if distances[best] <= self.duplicate_index.max_distance else None
+    
+    def _reuse_embedding(self, item):
+        """
+        Stored embedding for this exact content, or for a near-identical image
+        already classified (burst captures); None means the model has to run
+        """
+        if self.embedding_store is None:
+            return None
         
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            probs = outputs.logits_per_image.softmax(dim=1).cpu().numpy()[0]
+        # Same content seen before (renamed, copied or touched file)
+        stored = self.embedding_store.get(item.content_hash)
+        if stored is not None or self.duplicate_index is None:
+            return stored
+        
+        match = self.duplicate_index.find(item.phash)
+        if match is None:
+            return None
+        stored = self.embedding_store.get(match)
+        if stored is not None:
+            item.duplicate_of = match
+            # Register under this content too, so search and reclassify see it
+            self.embedding_store.add_many([item.content_hash], stored[None])
+        return stored
+    
+    def classify_embeddings(self, embeddings: np.ndarray, sizes: list) -> list:
+        """
+        Re-derive results for stored embeddings without running the vision model
+        sizes holds the original (width, height) of each row
+        """
+        if not self.initialized:
+            raise RuntimeError("Classifier not initialized. Call initialize() first.")
+        
+        embeddings = torch.from_numpy(np.asarray(embeddings, dtype=np.float32)).to(self.device)
+        embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+        probs, subcategories = self._score_embeddings(embeddings)
+        
+        return [
+            self._build_classification(probs[i], int(subcategories[i]), width, height)
+            for i, (width, height) in enumerate(sizes)
+        ]
+    
+    def _score_embeddings(self, embeddings: torch.Tensor) -> tuple:
+        """
+        Score normalized image embeddings against the cached prompt embeddings
+        Returns (category probabilities, best subcategory index) per row
+        """
+        with STAGE_SECONDS.time(stage="scoring"):
+            # Cosine similarity against the cached prompt embeddings
+            logits = self.logit_scale * embeddings @ self.category_embeddings.T
+            probs = logits.softmax(dim=-1).cpu().numpy()
+            
+            # Argmax of the logits equals argmax of the softmax, so skip it
+            subcategories = (embeddings @ self.subcategory_embeddings.T).argmax(dim=-1).cpu().numpy()
+        
+        return probs, subcategories
+    
+    def _classify_embedding(self, embedding: torch.Tensor, width: int, height: int) -> dict:
+        """Derive the classification result from a normalized image embedding"""
+        probs, subcategories = self._score_embeddings(embedding.unsqueeze(0))
+        return self._build_classification(probs[0], int(subcategories[0]), width, height)
+    
+    def _build_classification(self, probs: np.ndarray, subcategory_index: int, width: int, height: int) -> dict:
+        """Apply the decision thresholds to one image's category probabilities"""
+        aspect_ratio = width / height
+        
+        # Calculate game vs non-game scores
+        # First 4 categories are game-related, rest are non-game
+        game_score = float(sum(probs[:4]))
+        non_game_score = float(sum(probs[4:]))
+        
+        # Get top predictions
+        top_indices = probs.argsort()[::-1][:5]
+        top_predictions = [
+            {"label": self.categories[i], "confidence": float(probs[i])}
+            for i in top_indices
+        ]
+        
+        # Determine if it's a game screenshot
+        # Be strict: game score must be significantly higher
+        is_game_screenshot = game_score > non_game_score * 1.5 and game_score > 0.3
+        
+        # Additional checks for common false positives
+        anime_score = float(probs[6]) + float(probs[7])  # anime + hentai
+        code_score = float(probs[4]) + float(probs[5])   # code + terminal
+        browser_score = float(probs[8])                   # browser
+        
+        # Reject if any non-game category is too high
+        if anime_score > 0.25 or code_score > 0.25 or browser_score > 0.2:
+            is_game_screenshot = False
+        
+        # Get game category if it's a game
+        category = "gaming"
+        detected_game = "Video Game"
         
-        top_idx = probs.argmax()
-        category = subcategory_keys[top_idx]
+        if is_game_screenshot:
+            category, detected_game = self._get_game_category(subcategory_index)
+        
+        confidence = game_score if is_game_screenshot else non_game_score
+        
+        return {
+            "isGameScreenshot": is_game_screenshot,
+            "confidence": min(0.99, max(0.1, confidence)),
+            "gameScore": game_score,
+            "nonGameScore": non_game_score,
+            "animeScore": anime_score,
+            "codeScore": code_score,
+            "detectedGame": detected_game,
+            "category": category,
+            "topPredictions": top_predictions,
+            "aspectRatio": aspect_ratio,
+            "resolution": f"{width}x{height}",
+            "tier": "model"
+        }
+    
+    def _prefilter_classification(self, item, score: float) -> dict:
+        """Result for an image the pre-filter rejected without running the model"""
+        width, height = item.size
+        return {
+            "isGameScreenshot": False,
+            "confidence": min(0.99, score),
+            "gameScore": 0.0,
+            "nonGameScore": score,
+            "animeScore": 0.0,
+            "codeScore": 0.0,
+            "detectedGame": "Video Game",
+            "category": "gaming",
+            "topPredictions": [{"label": "pre-filter: UI, code or document capture", "confidence": score}],
+            "aspectRatio": width / height,
+            "resolution": f"{width}x{height}",
+            "contentHash": item.content_hash,
+            "perceptualHash": f"{item.phash:016x}",
+            "tier": "prefilter"
+        }
+    
+    def _get_game_category(self, subcategory_index: int) -> tuple:
+        """Map the best-matching subcategory prompt to a category and game type"""
+        subcategory_keys = list(self.game_subcategories.keys())
+        category = subcategory_keys[subcategory_index]
         
         # Map category to game type description
         game_types = {
@@ -185,6 +497,7 @@ class GameScreenshotClassifier:
     
     def _fallback_classification(self, image_path: str) -> dict:
         """Fallback when classification fails"""
+        FALLBACKS.inc()
         filename = os.path.basename(image_path).lower()
         
         # Check for known game patterns in filename
@@ -207,7 +520,8 @@ class GameScreenshotClassifier:
             "category": "gaming",
             "topPredictions": [{"label": "Fallback classification", "confidence": 0.5}],
             "aspectRatio": 1.78,
-            "resolution": "unknown"
+            "resolution": "unknown",
+            "tier": "fallback"
         }
 
 
@@ -0,0 +1,87 @@
+"""
+Near-duplicate detection
+A 64-bit difference hash catches burst captures before inference, and
+embedding similarity groups the gallery into duplicate clusters
+"""
+
+import threading
+import numpy as np
+from PIL import Image
+
+# Number of set bits in every byte value, for vectorized Hamming distance
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit dHash: compares neighbouring pixels of a 9x8 grayscale thumbnail"""
+    small = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming_distances(hashes: np.ndarray, phash: int) -> np.ndarray:
+    """Bit distance between phash and every entry of a uint64 array"""
+    xor = np.bitwise_xor(hashes, np.uint64(phash))
+    return _POPCOUNT[xor.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+class PerceptualIndex:
+    """Maps perceptual hashes to the content hash of the image that produced them"""
+
+    def __init__(self, max_distance: int = 4):
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.content_hashes = []
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, phash: int, content_hash: str):
+        with self.lock:
+            if self.count == len(self.hashes):
+                grown = np.zeros(max(1024, len(self.hashes) * 2), dtype=np.uint64)
+                grown[:self.count] = self.hashes[:self.count]
+                self.hashes = grown
+            self.hashes[self.count] = phash
+            self.content_hashes.append(content_hash)
+            self.count += 1
+
+    def find(self, phash: int):
+        """Content hash of the closest known image within max_distance bits, or None"""
+        with self.lock:
+            if not self.count:
+                return None
+            distances = hamming_distances(self.hashes[:self.count], phash)
+            best = int(distances.argmin())
+            if distances[best] > self.max_distance:
+                return None
+            return self.content_hashes[best]
+
+
+def cluster_by_embedding(embeddings: np.ndarray, threshold: float = 0.97, window: int = 32) -> np.ndarray:
+    """
+    Group near-identical images into clusters
+    embeddings must be normalized and ordered by capture time; bursts are
+    adjacent in that order, so each image is only compared with the next
+    `window` images. Returns a cluster label per row (the row of its first member)
+    """
+    count = len(embeddings)
+    parent = np.arange(count)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    for offset in range(1, min(window, count - 1) + 1):
+        similarities = np.einsum("ij,ij->i", embeddings[:-offset], embeddings[offset:])
+        for i in np.flatnonzero(similarities >= threshold):
+            a, b = find(i), find(i + offset)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    return np.array([find(i) for i in range(count)])
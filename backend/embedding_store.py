@@ -0,0 +1,139 @@
+"""
+Image embedding store
+Keeps one float16 CLIP image embedding per unique file content in an
+append-only memory-mapped array, so results can be re-derived from the
+embeddings without running the vision model again
+"""
+
+import os
+import json
+import threading
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    embeddings.f16  - row-major float16 matrix, one row per image
+    embeddings.ids  - content hash of each row, one per line, same order
+    embeddings.json - dimension of the rows; a mismatch resets the store
+    """
+
+    def __init__(self, directory: str, dim: int):
+        self.directory = directory
+        self.dim = dim
+        self.lock = threading.Lock()
+        self.matrix_path = os.path.join(directory, "embeddings.f16")
+        self.ids_path = os.path.join(directory, "embeddings.ids")
+        self.meta_path = os.path.join(directory, "embeddings.json")
+        self.ids = []
+        self.rows = {}
+        self._matrix = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        meta = {}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+
+        if meta.get("dim") != self.dim:
+            # Different model (or first run): start from an empty store
+            for path in (self.matrix_path, self.ids_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            with open(self.meta_path, "w") as f:
+                json.dump({"dim": self.dim, "dtype": "float16"}, f)
+            return
+
+        ids = []
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, "r") as f:
+                ids = [line.strip() for line in f if line.strip()]
+
+        # Rows are written before ids, so a crash can only leave extra rows behind
+        row_bytes = self.dim * 2
+        stored_rows = os.path.getsize(self.matrix_path) // row_bytes if os.path.exists(self.matrix_path) else 0
+        count = min(len(ids), stored_rows)
+        if stored_rows != count or len(ids) != count:
+            with open(self.matrix_path, "r+b") as f:
+                f.truncate(count * row_bytes)
+            with open(self.ids_path, "w") as f:
+                f.writelines(f"{content_hash}\n" for content_hash in ids[:count])
+
+        self.ids = ids[:count]
+        self.rows = {content_hash: row for row, content_hash in enumerate(self.ids)}
+
+    def clear(self):
+        """
+        Drop every stored embedding
+        The store's own memmap is closed first, since Windows won't truncate a
+        mapped file; views from matrix() still held by callers must be gone too
+        """
+        with self.lock:
+            self._matrix = None
+            self.ids = []
+            self.rows = {}
+            for path in (self.matrix_path, self.ids_path):
+                open(path, "wb").close()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, content_hash: str) -> bool:
+        return content_hash in self.rows
+
+    def matrix(self) -> np.ndarray:
+        """Read-only (N, dim) float16 view of every stored embedding"""
+        with self.lock:
+            if self._matrix is None or len(self._matrix) != len(self.ids):
+                if not self.ids:
+                    return np.zeros((0, self.dim), dtype=np.float16)
+                self._matrix = np.memmap(
+                    self.matrix_path, dtype=np.float16, mode="r",
+                    shape=(len(self.ids), self.dim)
+                )
+            return self._matrix
+
+    def get(self, content_hash: str):
+        """Embedding for content_hash, or None if it was never stored"""
+        row = self.rows.get(content_hash)
+        if row is None:
+            return None
+        # A copy, so no caller keeps the file mapped
+        return np.array(self.matrix()[row])
+
+    def get_many(self, content_hashes: list) -> tuple:
+        """
+        Stack the embeddings that exist for content_hashes
+        Returns (matrix, positions) where positions index into content_hashes
+        """
+        positions = [i for i, content_hash in enumerate(content_hashes) if content_hash in self.rows]
+        rows = [self.rows[content_hashes[i]] for i in positions]
+        return np.asarray(self.matrix()[rows]), positions
+
+    def add_many(self, content_hashes: list, embeddings: np.ndarray):
+        """Append embeddings for content hashes that aren't stored yet"""
+        embeddings = np.asarray(embeddings, dtype=np.float16).reshape(-1, self.dim)
+
+        with self.lock:
+            new = []
+            seen = set()
+            for i, content_hash in enumerate(content_hashes):
+                # Skip known content, including duplicates within this batch
+                if content_hash and content_hash not in self.rows and content_hash not in seen:
+                    seen.add(content_hash)
+                    new.append(i)
+            if not new:
+                return
+
+            with open(self.matrix_path, "ab") as f:
+                f.write(np.ascontiguousarray(embeddings[new]).tobytes())
+            with open(self.ids_path, "a") as f:
+                f.writelines(f"{content_hashes[i]}\n" for i in new)
+
+            for i in new:
+                self.rows[content_hashes[i]] = len(self.ids)
+                self.ids.append(content_hashes[i])
+            self._matrix = None
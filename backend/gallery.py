@@ -0,0 +1,344 @@
+"""
+Gallery index
+The game screenshots currently shown, as compact records indexed by id,
+by path and by date, with per-category views and counts
+"""
+
+import sys
+import threading
+from bisect import bisect_left
+from collections.abc import Mapping
+
+# Record fields, in the order they are serialized
+FIELDS = (
+    "id", "url", "folder", "fileName", "filePath", "title",
+    "game", "category", "confidence", "isGameScreenshot",
+    "gameScore", "nonGameScore", "animeScore", "codeScore", "topPredictions",
+    "resolution", "contentHash", "perceptualHash", "duplicateOf",
+    "dateAdded", "fileSize", "thumbnails", "thumbnailUrl", "tier"
+)
+_FIELD_SET = frozenset(FIELDS)
+
+# Low-cardinality strings repeated across many records share one object
+_INTERNED = ("folder", "game", "category", "resolution", "tier")
+
+_MISSING = object()
+
+
+class Screenshot(Mapping):
+    """
+    One gallery record: a read-only mapping over __slots__, so code that
+    reads records like dicts keeps working. Fields a record never had stay
+    unset and are left out of it; keys outside FIELDS go to extra
+    """
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(self, result: Mapping):
+        extra = None
+        for key, value in result.items():
+            if key not in _FIELD_SET:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+                continue
+            if key in _INTERNED and isinstance(value, str):
+                value = sys.intern(value)
+            elif key == "topPredictions" and value is not None:
+                value = tuple(
+                    (sys.intern(p["label"]), p["confidence"]) if isinstance(p, Mapping) else tuple(p)
+                    for p in value
+                )
+            object.__setattr__(self, key, value)
+        object.__setattr__(self, "extra", extra)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Screenshot records are immutable; index a new one instead")
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                if key == "topPredictions" and value is not None:
+                    return [{"label": label, "confidence": confidence} for label, confidence in value]
+                return value
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for key in FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"Screenshot({getattr(self, 'id', '?')!r}, {getattr(self, 'filePath', '?')!r})"
+
+    def to_dict(self) -> dict:
+        """A plain dict for serialization; cheaper than dict(record)"""
+        result = {}
+        for key in FIELDS:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                result[key] = value
+        predictions = result.get("topPredictions")
+        if predictions is not None:
+            result["topPredictions"] = [{"label": label, "confidence": confidence} for label, confidence in predictions]
+        if self.extra is not None:
+            result.update(self.extra)
+        return result
+
+    @property
+    def key(self) -> tuple:
+        """Gallery order key; the gallery is shown in descending order of this"""
+        return (self.dateAdded, self.id)
+
+
+class SortedRecords:
+    """
+    Records in ascending key order, kept in bounded blocks: an insert or
+    remove is a bisect over the block maxima plus a shift within one block,
+    not a shift of the whole gallery
+    """
+    BLOCK_SIZE = 512
+
+    def __init__(self, items: list = ()):
+        """items: (key, record) pairs in ascending key order"""
+        self.keys = []  # One sorted list of keys per block
+        self.values = []  # The matching records
+        self.maxes = []  # Last key of each block
+        self.size = 0
+        for start in range(0, len(items), self.BLOCK_SIZE):
+            block = items[start:start + self.BLOCK_SIZE]
+            self.keys.append([key for key, _ in block])
+            self.values.append([record for _, record in block])
+            self.maxes.append(block[-1][0])
+            self.size += len(block)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, key: tuple, record):
+        if not self.keys:
+            self.keys.append([key])
+            self.values.append([record])
+            self.maxes.append(key)
+            self.size = 1
+            return
+
+        i = min(bisect_left(self.maxes, key), len(self.maxes) - 1)
+        keys, values = self.keys[i], self.values[i]
+        pos = bisect_left(keys, key)
+        keys.insert(pos, key)
+        values.insert(pos, record)
+        self.maxes[i] = keys[-1]
+        self.size += 1
+
+        if len(keys) > 2 * self.BLOCK_SIZE:
+            half = len(keys) // 2
+            self.keys[i:i + 1] = [keys[:half], keys[half:]]
+            self.values[i:i + 1] = [values[:half], values[half:]]
+            self.maxes[i:i + 1] = [keys[half - 1], keys[-1]]
+
+    def remove(self, key: tuple) -> bool:
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return False
+        keys, values = self.keys[i], self.values[i]
+        pos = bisect_left(keys, key)
+        if pos == len(keys) or keys[pos] != key:
+            return False
+
+        del keys[pos]
+        del values[pos]
+        self.size -= 1
+        if keys:
+            self.maxes[i] = keys[-1]
+        else:
+            del self.keys[i], self.values[i], self.maxes[i]
+        return True
+
+    def descending(self, before: tuple = None):
+        """Records newest first, starting with the first one whose key is below before"""
+        if not self.keys:
+            return
+        if before is None:
+            i = len(self.keys) - 1
+            pos = len(self.keys[i])
+        else:
+            i = bisect_left(self.maxes, before)
+            if i == len(self.maxes):
+                i -= 1
+                pos = len(self.keys[i])
+            else:
+                pos = bisect_left(self.keys[i], before)
+
+        while i >= 0:
+            values = self.values[i]
+            for j in range(pos - 1, -1, -1):
+                yield values[j]
+            i -= 1
+            if i >= 0:
+                pos = len(self.values[i])
+
+
+class GalleryIndex:
+    """
+    Every mutation and every read that spans several records holds lock;
+    callers take it too when a lookup and an update must be atomic
+    on_change(op, record) is called under the lock for each add, update and remove
+    """
+
+    def __init__(self, on_change=None):
+        self.lock = threading.RLock()
+        self.on_change = on_change
+        self.version = 0  # Bumped on every change, for caches derived from the gallery
+        self.by_id = {}
+        self.by_path = {}
+        self.ordered = SortedRecords()
+        self.by_category = {}  # category -> SortedRecords of that category
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, screenshot_id):
+        return screenshot_id in self.by_id
+
+    def get(self, screenshot_id: str) -> Screenshot | None:
+        return self.by_id.get(screenshot_id)
+
+    def get_by_path(self, path: str) -> Screenshot | None:
+        return self.by_path.get(path)
+
+    def ids(self) -> set:
+        with self.lock:
+            return set(self.by_id)
+
+    def snapshot(self) -> dict:
+        """id -> record as of now; records are immutable, so identity tells whether one changed since"""
+        with self.lock:
+            return dict(self.by_id)
+
+    def count(self, category: str = None) -> int:
+        if category is None:
+            return len(self.by_id)
+        view = self.by_category.get(category)
+        return len(view) if view is not None else 0
+
+    def category_counts(self) -> dict:
+        """category -> number of screenshots, for every category with any"""
+        with self.lock:
+            return {category: len(view) for category, view in self.by_category.items()}
+
+    def add(self, result: Mapping) -> Screenshot:
+        """Index a record, replacing any with the same id; returns the stored record"""
+        record = result if isinstance(result, Screenshot) else Screenshot(result)
+        with self.lock:
+            previous = self.by_id.get(record.id)
+            if previous is not None:
+                self._unlink(previous)
+            self._link(record)
+            self.version += 1
+            self._notify("add" if previous is None else "update", record)
+        return record
+
+    def remove(self, screenshot_id: str) -> Screenshot | None:
+        with self.lock:
+            record = self.by_id.get(screenshot_id)
+            if record is not None:
+                self._unlink(record)
+                self.version += 1
+                self._notify("remove", record)
+        return record
+
+    def remove_under(self, prefix: str) -> list:
+        """Remove every record whose path starts with prefix"""
+        with self.lock:
+            gone = [record for path, record in self.by_path.items() if path.startswith(prefix)]
+            for record in gone:
+                self.remove(record.id)
+        return gone
+
+    def replace_all(self, results: list):
+        """
+        Swap in a whole new gallery (after a scan or a cache restore),
+        reporting the difference from the current one through on_change
+        """
+        records = [r if isinstance(r, Screenshot) else Screenshot(r) for r in results]
+        by_id = {record.id: record for record in records}
+        records = list(by_id.values())
+        ordered = sorted(records, key=lambda record: record.key)
+
+        categories = {}
+        for record in ordered:
+            categories.setdefault(record.category, []).append((record.key, record))
+
+        with self.lock:
+            before = self.by_id
+            self.by_id = by_id
+            self.by_path = {record.filePath: record for record in records}
+            self.ordered = SortedRecords([(record.key, record) for record in ordered])
+            self.by_category = {category: SortedRecords(items) for category, items in categories.items()}
+
+            changes = [("remove", old) for screenshot_id, old in before.items() if screenshot_id not in by_id]
+            for record in ordered:
+                old = before.get(record.id)
+                if old is None:
+                    changes.append(("add", record))
+                elif old is not record and old != record:
+                    changes.append(("update", record))
+
+            # A rescan that finds nothing new leaves the version, and everything cached on it, alone
+            if changes:
+                self.version += 1
+            for op, record in changes:
+                self._notify(op, record)
+
+    def touch(self):
+        """Bump the version without a change, when state derived from the gallery goes stale"""
+        with self.lock:
+            self.version += 1
+
+    def page(self, category: str = None, before: tuple = None, limit: int = None) -> list:
+        """Records newest first, optionally one category's, older than the key before"""
+        with self.lock:
+            view = self.ordered if category is None else self.by_category.get(category)
+            if view is None:
+                return []
+            records = view.descending(before)
+            if limit is None:
+                return list(records)
+            page = []
+            for record in records:
+                page.append(record)
+                if len(page) == limit:
+                    break
+            return page
+
+    def _link(self, record: Screenshot):
+        self.by_id[record.id] = record
+        self.by_path[record.filePath] = record
+        self.ordered.add(record.key, record)
+        view = self.by_category.get(record.category)
+        if view is None:
+            view = self.by_category[record.category] = SortedRecords()
+        view.add(record.key, record)
+
+    def _unlink(self, record: Screenshot):
+        del self.by_id[record.id]
+        if self.by_path.get(record.filePath) is record:
+            del self.by_path[record.filePath]
+        self.ordered.remove(record.key)
+        view = self.by_category.get(record.category)
+        if view is not None:
+            view.remove(record.key)
+            if not view:
+                del self.by_category[record.category]
+
+    def _notify(self, op: str, record: Screenshot):
+        if self.on_change is not None:
+            self.on_change(op, record)
@@ -0,0 +1,276 @@
+"""
+CPU inference backends
+Runs the vision half of CLIP (the only part on the hot path) eagerly,
+int8-quantized, compiled/traced, or through ONNX Runtime, behind one
+encode() call
+"""
+
+import os
+import time
+import numpy as np
+import torch
+from torch import nn
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+
+class VisionEncoder(nn.Module):
+    """vision_model + visual_projection as one module, so it can be quantized, traced or exported"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.vision_model = model.vision_model
+        self.visual_projection = model.visual_projection
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        pooled = self.vision_model(pixel_values=pixel_values).pooler_output
+        return self.visual_projection(pooled)
+
+
+class InferenceBackend:
+    """encode() maps a (batch, 3, 224, 224) pixel tensor to unnormalized image embeddings"""
+    name = None
+
+    def __init__(self, model, device: str = "cpu", **options):
+        self.device = device
+        self.encoder = VisionEncoder(model).eval()
+
+    def encode(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        with torch.inference_mode():
+            return self.encoder(pixel_values.to(self.device))
+
+    def _example(self, batch: int = 2) -> torch.Tensor:
+        size = self.encoder.vision_model.config.image_size
+        return torch.zeros(batch, 3, size, size, device=self.device)
+
+
+class EagerBackend(InferenceBackend):
+    """The model as loaded: fp32 eager PyTorch, the reference for drift checks"""
+    name = "fp32"
+
+
+class QuantizedBackend(InferenceBackend):
+    """Linear layers (most of ViT's FLOPs) dynamically quantized to int8"""
+    name = "int8"
+
+    def __init__(self, model, device: str = "cpu", **options):
+        if device != "cpu":
+            raise ValueError("The int8 backend runs on CPU only")
+        super().__init__(model, device)
+        # Returns a quantized copy; the fp32 model stays intact for the text encoder
+        self.encoder = torch.ao.quantization.quantize_dynamic(self.encoder, {nn.Linear}, dtype=torch.qint8)
+
+
+class CompiledBackend(InferenceBackend):
+    """torch.compile (Inductor); the first batch of each new shape pays the compile time"""
+    name = "compile"
+
+    def __init__(self, model, device: str = "cpu", **options):
+        super().__init__(model, device)
+        self.encoder = torch.compile(self.encoder, dynamic=True)
+
+
+class TorchScriptBackend(InferenceBackend):
+    """Traced, frozen TorchScript graph"""
+    name = "torchscript"
+
+    def __init__(self, model, device: str = "cpu", **options):
+        super().__init__(model, device)
+        with torch.inference_mode():
+            traced = torch.jit.trace(self.encoder, self._example(), strict=False)
+        self.encoder = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+
+class OnnxBackend(InferenceBackend):
+    """
+    ONNX Runtime on CPU. The vision encoder is exported once to cache_dir;
+    delete the .onnx file after changing models to re-export it
+    """
+    name = "onnx"
+
+    def __init__(self, model, device: str = "cpu", threads: int = None, interop_threads: int = None,
+                 cache_dir: str = "models", **options):
+        if onnxruntime is None:
+            raise ImportError("The onnx backend needs onnxruntime (pip install onnxruntime onnx)")
+        super().__init__(model, "cpu")
+
+        model_name = getattr(model.config, "_name_or_path", "") or "clip"
+        path = os.path.join(cache_dir, f"{model_name.replace('/', '_')}-vision.onnx")
+        if not os.path.exists(path):
+            self._export(path)
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            session_options.intra_op_num_threads = threads
+        if interop_threads:
+            session_options.inter_op_num_threads = interop_threads
+        self.session = onnxruntime.InferenceSession(path, session_options, providers=["CPUExecutionProvider"])
+        self.encoder = None
+
+    def _export(self, path: str):
+        print(f"📦 Exporting vision encoder to {path}...")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"  # Pool workers may export at the same time
+        torch.onnx.export(
+            self.encoder,
+            (self._example(),),
+            tmp_path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            dynamo=False
+        )
+        os.replace(tmp_path, path)
+
+    def encode(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        pixels = pixel_values.detach().cpu().numpy().astype(np.float32, copy=False)
+        (embeds,) = self.session.run(None, {"pixel_values": pixels})
+        return torch.from_numpy(embeds)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (EagerBackend, QuantizedBackend, CompiledBackend, TorchScriptBackend, OnnxBackend)
+}
+
+
+def configure_threads(threads: int = None, interop_threads: int = None):
+    """
+    PyTorch intra-op (per-operator) and inter-op thread counts; None keeps the
+    default. The inter-op count can only be set before PyTorch starts any parallel work
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            print(f"⚠️ Could not set inter-op threads: {e}")
+
+
+def create_backend(name: str, model, device: str = "cpu", **options) -> InferenceBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}; expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](model, device, **options)
+
+
+def validate_backends(classifier, image_paths: list, backends: list, batch_size: int = 16, **options) -> list:
+    """
+    Throughput of each backend, and how far its decisions drift from fp32
+    on the same images. Decoding is done once up front so only encoding is timed
+    """
+    batches = []
+    sizes = []
+    for batch in classifier.pipeline.batches(image_paths, batch_size):
+        batch = [item for item in batch if item.error is None]
+        if batch:
+            batches.append(torch.stack([item.pixel_values for item in batch]))
+            sizes.extend(item.size for item in batch)
+
+    image_count = len(sizes)
+    if not image_count:
+        raise ValueError("No readable images in the sample")
+
+    backends = ["fp32"] + [name for name in backends if name != "fp32"]
+    reports = []
+    reference = None
+
+    for name in backends:
+        try:
+            backend = create_backend(name, classifier.model, classifier.device, **options)
+            # Warm-up, so one-off costs (compilation, allocator growth) aren't timed
+            backend.encode(batches[0])
+
+            start = time.perf_counter()
+            embeddings = torch.cat([backend.encode(batch).float().cpu() for batch in batches])
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            reports.append({"backend": name, "error": str(e)})
+            print(f"❌ {name}: {e}")
+            continue
+
+        embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+        results = classifier.classify_embeddings(embeddings.numpy(), sizes)
+        report = {
+            "backend": name,
+            "images": image_count,
+            "seconds": round(elapsed, 3),
+            "imagesPerSecond": round(image_count / elapsed, 1)
+        }
+
+        if reference is None:
+            reference = (embeddings, results, elapsed)
+        else:
+            ref_embeddings, ref_results, ref_elapsed = reference
+            cosine = (embeddings * ref_embeddings).sum(dim=-1)
+            report.update({
+                "speedup": round(ref_elapsed / elapsed, 2),
+                "gameAgreement": sum(
+                    a["isGameScreenshot"] == b["isGameScreenshot"] for a, b in zip(results, ref_results)
+                ) / image_count,
+                "categoryAgreement": sum(
+                    a["category"] == b["category"] for a, b in zip(results, ref_results)
+                ) / image_count,
+                "maxGameScoreDrift": max(
+                    abs(a["gameScore"] - b["gameScore"]) for a, b in zip(results, ref_results)
+                ),
+                "meanCosine": float(cosine.mean()),
+                "minCosine": float(cosine.min())
+            })
+
+        reports.append(report)
+
+    return reports
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+    from classifier import GameScreenshotClassifier
+    from library import walk_roots
+
+    parser = argparse.ArgumentParser(description="Compare inference backends against fp32 on a sample of images")
+    parser.add_argument("sample", nargs="+", help="Folders to sample images from (searched recursively)")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Comma-separated backends to compare")
+    parser.add_argument("--limit", type=int, default=256, help="Number of sample images")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads")
+    parser.add_argument("--interop-threads", type=int, default=None, help="Inter-op threads")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    configure_threads(args.threads, args.interop_threads)
+    classifier = GameScreenshotClassifier()
+    classifier.initialize()
+
+    extensions = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif")
+    paths = sorted(walk_roots(args.sample, lambda name: name.lower().endswith(extensions)))[:args.limit]
+    print(f"\n🧪 Validating on {len(paths)} images...\n")
+
+    reports = validate_backends(
+        classifier,
+        paths,
+        [name.strip() for name in args.backends.split(",") if name.strip()],
+        batch_size=args.batch_size,
+        threads=args.threads,
+        interop_threads=args.interop_threads
+    )
+
+    print(f"{'backend':<12} {'img/s':>8} {'speedup':>8} {'game agree':>11} {'cat agree':>10} {'min cos':>8}")
+    for report in reports:
+        if "error" in report:
+            print(f"{report['backend']:<12} failed: {report['error']}")
+            continue
+        print(
+            f"{report['backend']:<12} {report['imagesPerSecond']:>8} {report.get('speedup', 1.0):>8} "
+            f"{report.get('gameAgreement', 1.0):>11.2%} {report.get('categoryAgreement', 1.0):>10.2%} "
+            f"{report.get('minCosine', 1.0):>8.4f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
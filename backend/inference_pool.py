@@ -0,0 +1,326 @@
+"""
+Inference worker pool
+Runs the vision encoder in worker processes, each holding its own
+GameScreenshotClassifier, so inference neither competes with request
+handling for the GIL nor stops at one model's worth of cores. Pixel
+batches and embeddings cross the process boundary through shared memory
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+import metrics
+
+WORKER_RESTARTS = metrics.Counter(
+    "screenshot_inference_worker_restarts_total",
+    "Inference worker processes restarted after a crash or hang"
+)
+
+
+class WorkerCrashed(RuntimeError):
+    """The worker died or stopped answering; it has been (or is being) restarted"""
+
+
+def _worker_main(conn, input_name: str, output_name: str, shape: tuple, embedding_dim: int, options: dict):
+    """Worker process: load a classifier, then encode batches from shared memory until told to stop"""
+    # Spawned workers share the server's resource tracker, which unlinks the blocks if the server dies
+    inputs = shared_memory.SharedMemory(name=input_name)
+    outputs = shared_memory.SharedMemory(name=output_name)
+    pixels = np.ndarray(shape, dtype=np.float32, buffer=inputs.buf)
+    embeds = np.ndarray((shape[0], embedding_dim), dtype=np.float32, buffer=outputs.buf)
+
+    try:
+        from classifier import GameScreenshotClassifier
+        classifier = GameScreenshotClassifier(decode_workers=1, **options)
+        classifier.initialize()
+    except Exception as e:
+        conn.send(("failed", str(e)))
+        return
+    conn.send(("ready", os.getpid()))
+
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == "encode":
+                count = message[1]
+                try:
+                    # from_numpy shares the buffer: the batch is never copied on this side
+                    encoded = classifier.backend.encode(torch.from_numpy(pixels[:count]))
+                    embeds[:count] = encoded.float().cpu().numpy()
+                    conn.send(("done", count))
+                except Exception as e:
+                    conn.send(("error", str(e)))
+            elif message[0] == "ping":
+                conn.send(("pong",))
+            else:
+                break
+    except (EOFError, KeyboardInterrupt):
+        pass  # The server went away
+    finally:
+        # Views must go before the blocks can be closed
+        del pixels, embeds
+        inputs.close()
+        outputs.close()
+
+
+class _Worker:
+    """One worker process and the shared-memory blocks it reads batches from and writes embeddings to"""
+
+    def __init__(self, index: int, shape: tuple, embedding_dim: int):
+        self.index = index
+        self.lock = threading.Lock()  # Held for each request/reply exchange
+        self.inputs = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+        self.outputs = shared_memory.SharedMemory(create=True, size=shape[0] * embedding_dim * 4)
+        self.pixels = np.ndarray(shape, dtype=np.float32, buffer=self.inputs.buf)
+        self.embeds = np.ndarray((shape[0], embedding_dim), dtype=np.float32, buffer=self.outputs.buf)
+        self.process = None
+        self.conn = None
+        self.pid = None
+        self.down = True  # Not running; left out of the idle queue until restarted
+        self.restarting = False
+        self.queued = False
+        self.requests = 0
+
+    def start(self, context, embedding_dim: int, options: dict, timeout: float):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, self.inputs.name, self.outputs.name, self.pixels.shape, embedding_dim, options),
+            name=f"inference-{self.index}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+        if not self.conn.poll(timeout):
+            self.stop()
+            raise WorkerCrashed(f"Inference worker {self.index} did not start within {timeout}s")
+        try:
+            status, detail = self.conn.recv()
+        except (EOFError, OSError):
+            status, detail = "failed", f"exited with code {self.process.exitcode}"
+        if status != "ready":
+            self.stop()
+            raise WorkerCrashed(f"Inference worker {self.index} failed to start: {detail}")
+        self.pid = detail
+        self.down = False
+
+    def encode(self, pixel_values: torch.Tensor, timeout: float) -> torch.Tensor:
+        count = len(pixel_values)
+        with self.lock:
+            self.pixels[:count] = pixel_values.detach().cpu().numpy()
+            reply = self._request(("encode", count), timeout)
+            if reply[0] == "error":
+                raise RuntimeError(reply[1])  # The model failed; the worker itself is fine
+            self.requests += 1
+            # Copied out, since the block is overwritten by the next batch
+            return torch.from_numpy(self.embeds[:count].copy())
+
+    def ping(self, timeout: float) -> bool:
+        try:
+            return self._request(("ping",), timeout)[0] == "pong"
+        except WorkerCrashed:
+            return False
+
+    def _request(self, message: tuple, timeout: float) -> tuple:
+        try:
+            self.conn.send(message)
+            if not self.conn.poll(timeout):
+                raise WorkerCrashed(f"Inference worker {self.index} did not answer within {timeout}s")
+            return self.conn.recv()
+        except (EOFError, OSError, BrokenPipeError):
+            raise WorkerCrashed(f"Inference worker {self.index} exited with code {self.process.exitcode}")
+
+    def stop(self, timeout: float = 5.0):
+        if self.process is not None and self.process.is_alive():
+            try:
+                self.conn.send(("stop",))
+            except (OSError, BrokenPipeError):
+                pass
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        if self.conn is not None:
+            self.conn.close()
+        self.down = True
+
+    def release(self):
+        del self.pixels, self.embeds
+        for block in (self.inputs, self.outputs):
+            block.close()
+            block.unlink()
+
+
+class InferencePool:
+    """
+    encode() is a drop-in for InferenceBackend.encode(), safe to call from
+    many threads; each call takes an idle worker. submit() runs a function
+    on one of the pool's dispatch threads, so callers can keep one batch per
+    worker in flight. A health thread pings idle workers and restarts dead ones
+    """
+
+    def __init__(self, workers: int, image_size: int, embedding_dim: int, batch_size: int = 16,
+                 options: dict = None, start_timeout: float = 300, request_timeout: float = 120,
+                 health_interval: float = 15):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)  # Largest batch one request carries; bigger ones are split
+        self.embedding_dim = embedding_dim
+        self.options = dict(options or {})
+        self.start_timeout = start_timeout
+        self.request_timeout = request_timeout
+        self.health_interval = health_interval
+        self.context = multiprocessing.get_context("spawn")  # Forking a process with torch threads can deadlock
+
+        shape = (self.batch_size, 3, image_size, image_size)
+        self.pool = [_Worker(index, shape, embedding_dim) for index in range(self.workers)]
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.restarts = 0
+        self.closed = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference-dispatch")
+        self.health_thread = threading.Thread(target=self._health_loop, name="inference-health", daemon=True)
+
+    def start(self):
+        """Start every worker (in parallel, since each loads the model) and the health checks"""
+        errors = []
+
+        def start_worker(worker):
+            try:
+                worker.start(self.context, self.embedding_dim, self.options, self.start_timeout)
+                self._checkin(worker)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=start_worker, args=(worker,)) for worker in self.pool]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            self.close()
+            raise errors[0]
+
+        atexit.register(self.close)
+        self.health_thread.start()
+
+    def encode(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return torch.cat([
+            self._encode_batch(pixel_values[start:start + self.batch_size])
+            for start in range(0, len(pixel_values), self.batch_size)
+        ])
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
+
+    def _encode_batch(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        crashes = 0
+        while True:
+            worker = self._checkout(time.monotonic() + self.request_timeout)
+            try:
+                return worker.encode(pixel_values, self.request_timeout)
+            except WorkerCrashed as e:
+                print(f"⚠️ {e}; restarting it")
+                crashes += 1
+                self._recover(worker)
+                # Retried once, on another worker; a batch that kills two workers is given up on
+                if crashes > 1:
+                    raise
+            finally:
+                self._checkin(worker)
+
+    def _checkout(self, deadline: float) -> _Worker:
+        while True:
+            try:
+                worker = self.idle.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise WorkerCrashed("No inference worker available") from None
+            with self.lock:
+                worker.queued = False
+                if not worker.down:
+                    return worker
+            # Down workers are requeued by the health thread once they restart
+
+    def _checkin(self, worker: _Worker):
+        with self.lock:
+            if worker.down or worker.queued or self.closed.is_set():
+                return
+            worker.queued = True
+        self.idle.put(worker)
+
+    def _recover(self, worker: _Worker):
+        """Take a worker out of rotation and restart it in the background"""
+        with self.lock:
+            if worker.restarting or self.closed.is_set():
+                return
+            worker.restarting = True
+            worker.down = True
+
+        def restart():
+            try:
+                if self._restart(worker):
+                    self._checkin(worker)
+            finally:
+                worker.restarting = False
+
+        threading.Thread(target=restart, name=f"inference-restart-{worker.index}", daemon=True).start()
+
+    def _restart(self, worker: _Worker) -> bool:
+        with worker.lock:
+            worker.stop()
+            if self.closed.is_set():
+                return False
+            with self.lock:
+                self.restarts += 1
+            WORKER_RESTARTS.inc()
+            try:
+                worker.start(self.context, self.embedding_dim, self.options, self.start_timeout)
+            except Exception as e:
+                print(f"❌ Could not restart inference worker {worker.index}: {e}")
+                return False
+        print(f"🔁 Inference worker {worker.index} restarted (pid {worker.pid})")
+        return True
+
+    def _health_loop(self):
+        while not self.closed.wait(self.health_interval):
+            for worker in self.pool:
+                if self.closed.is_set():
+                    return
+                if worker.down:
+                    self._recover(worker)  # A restart that failed earlier
+                    continue
+                # Busy workers are skipped; a crash mid-request is caught by the request itself
+                if not worker.lock.acquire(blocking=False):
+                    continue
+                try:
+                    healthy = worker.ping(timeout=min(10.0, self.request_timeout))
+                finally:
+                    worker.lock.release()
+                if not healthy:
+                    print(f"⚠️ Inference worker {worker.index} failed its health check; restarting it")
+                    self._recover(worker)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for worker in self.pool if not worker.down),
+            "restarts": self.restarts,
+            "pids": [worker.pid for worker in self.pool]
+        }
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for worker in self.pool:
+            with worker.lock:
+                worker.stop()
+                worker.release()
@@ -0,0 +1,205 @@
+"""
+Asynchronous ingest queue
+Sits between the watchdog observer and classification: coalesces repeated
+events per path, waits until a file has stopped changing, and hands stable
+files to a worker pool in batches
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+
+class PendingFile:
+    """A path waiting for its size and mtime to settle"""
+    __slots__ = ("first_seen", "last_event", "signature", "stable_since")
+
+    def __init__(self, now: float):
+        self.first_seen = now
+        self.last_event = now
+        self.signature = None
+        self.stable_since = now
+
+
+class IngestQueue:
+    """
+    submit() returns immediately unless max_pending files are already queued,
+    in which case it blocks the caller (the observer thread) until workers
+    catch up, so a bulk copy can't grow the queue without bound.
+    One created paused keeps accepting files but holds them until resume()
+    """
+
+    def __init__(self, process, workers: int = 1, batch_size: int = 16, max_pending: int = 1000,
+                 settle_seconds: float = 0.5, poll_interval: float = 0.25, give_up_seconds: float = 300,
+                 paused: bool = False):
+        self.process = process
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.max_pending = max(1, max_pending)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.give_up_seconds = give_up_seconds
+
+        self.cond = threading.Condition()
+        self.pending = {}  # path -> PendingFile
+        self.ready = deque()  # (path, first_seen), stable and waiting for a worker
+        self.ready_paths = set()
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.abandoned = 0
+        self.stopped = False
+        self.paused = paused
+        self.threads = []
+
+    def start(self):
+        self.threads = [threading.Thread(target=self._watch_stability, name="ingest-stability", daemon=True)]
+        self.threads += [
+            threading.Thread(target=self._work, name=f"ingest-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def resume(self):
+        """Let workers start on files held while paused"""
+        with self.cond:
+            self.paused = False
+            self.cond.notify_all()
+
+    def submit(self, path: str):
+        """Queue a path, or push back its deadline if it is already queued"""
+        now = time.monotonic()
+        with self.cond:
+            item = self.pending.get(path)
+            if item is not None:
+                item.last_event = now
+                return
+
+            if path in self.ready_paths:
+                # Written to again before a worker got to it: wait for it to settle again
+                self._remove_ready(path)
+            else:
+                while len(self.pending) + len(self.ready) >= self.max_pending and not self.stopped:
+                    self.cond.wait()
+
+            self.pending[path] = PendingFile(now)
+            self.cond.notify_all()
+
+    def discard(self, path: str):
+        """Forget a queued path (the file was deleted or moved away)"""
+        with self.cond:
+            self.pending.pop(path, None)
+            if path in self.ready_paths:
+                self._remove_ready(path)
+            self.cond.notify_all()
+
+    def _remove_ready(self, path: str):
+        self.ready_paths.discard(path)
+        self.ready = deque(entry for entry in self.ready if entry[0] != path)
+
+    def stats(self) -> dict:
+        """Queue depth and how far behind ingest is, for /api/stats"""
+        now = time.monotonic()
+        with self.cond:
+            waiting = [item.first_seen for item in self.pending.values()]
+            waiting += [first_seen for _, first_seen in self.ready]
+            return {
+                "pending": len(self.pending),
+                "ready": len(self.ready),
+                "inFlight": self.in_flight,
+                "paused": self.paused,
+                "lagSeconds": round(now - min(waiting), 3) if waiting else 0.0,
+                "processed": self.processed,
+                "failed": self.failed,
+                "abandoned": self.abandoned,
+            }
+
+    def _check(self, path: str, item: PendingFile, now: float) -> str:
+        """'ready', 'wait' or 'drop' for one pending file"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return "drop"
+
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if signature != item.signature:
+            item.signature = signature
+            item.stable_since = now
+            return "wait"
+
+        if stat.st_size == 0 or now - item.stable_since < self.settle_seconds:
+            return "wait"
+        if now - item.last_event < self.settle_seconds:
+            return "wait"
+
+        # Writers on Windows hold the file locked until they finish
+        try:
+            with open(path, "rb"):
+                pass
+        except OSError:
+            return "wait"
+
+        return "ready"
+
+    def _watch_stability(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self.cond:
+                if self.stopped:
+                    return
+                items = list(self.pending.items())
+
+            now = time.monotonic()
+            decisions = [(path, item, self._check(path, item, now)) for path, item in items]
+
+            with self.cond:
+                for path, item, decision in decisions:
+                    # Skip anything that was discarded or re-submitted meanwhile
+                    if self.pending.get(path) is not item:
+                        continue
+                    if decision == "wait" and now - item.first_seen > self.give_up_seconds:
+                        print(f"⚠️ {os.path.basename(path)} never stopped changing - skipping")
+                        self.abandoned += 1
+                        decision = "drop"
+                    if decision == "ready":
+                        del self.pending[path]
+                        self.ready.append((path, item.first_seen))
+                        self.ready_paths.add(path)
+                    elif decision == "drop":
+                        del self.pending[path]
+                self.cond.notify_all()
+
+    def _work(self):
+        while True:
+            with self.cond:
+                while (not self.ready or self.paused) and not self.stopped:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                batch = []
+                while self.ready and len(batch) < self.batch_size:
+                    path, _ = self.ready.popleft()
+                    self.ready_paths.discard(path)
+                    batch.append(path)
+                self.in_flight += len(batch)
+                self.cond.notify_all()
+
+            failed = 0
+            try:
+                self.process(batch)
+            except Exception as e:
+                print(f"❌ Error ingesting {len(batch)} files: {e}")
+                failed = len(batch)
+            finally:
+                with self.cond:
+                    self.in_flight -= len(batch)
+                    self.processed += len(batch) - failed
+                    self.failed += failed
+                    self.cond.notify_all()
@@ -0,0 +1,125 @@
+"""
+Background jobs
+Long operations such as rescans run on their own thread with progress
+counters, a status endpoint and cooperative cancellation
+"""
+
+import uuid
+import time
+import threading
+from collections import OrderedDict
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation was requested"""
+
+
+class Job:
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = "queued"
+        self.counters = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def check_cancelled(self):
+        """Call between units of work; unwinds the job if it was cancelled"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "counters": dict(self.counters),
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobManager:
+    """
+    Runs jobs on background threads, at most one active job per kind, and
+    remembers the most recent ones for status lookups
+    """
+
+    def __init__(self, on_update=None, history: int = 50):
+        self.on_update = on_update
+        self.history = history
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+
+    def start(self, kind: str, target, exclusive: bool = True) -> tuple:
+        """
+        Run target(job) in the background
+        Returns (job, created); with exclusive, an active job of the same kind is
+        returned instead of starting a second one
+        """
+        with self.lock:
+            if exclusive:
+                for job in self.jobs.values():
+                    if job.kind == kind and job.active:
+                        return job, False
+
+            job = Job(kind)
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history:
+                self.jobs.popitem(last=False)
+
+        thread = threading.Thread(target=self._run, args=(job, target), name=f"job-{kind}", daemon=True)
+        thread.start()
+        return job, True
+
+    def get(self, job_id: str):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def active(self, kind: str = None) -> list:
+        with self.lock:
+            return [job for job in self.jobs.values() if job.active and (kind is None or job.kind == kind)]
+
+    def cancel(self, job_id: str):
+        job = self.get(job_id)
+        if job is not None and job.active:
+            job.cancel_event.set()
+        return job
+
+    def update(self, job: Job):
+        """Publish the job's current counters"""
+        if self.on_update:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                print(f"⚠️ Could not publish job progress: {e}")
+
+    def _run(self, job: Job, target):
+        job.status = "running"
+        job.started = time.time()
+        self.update(job)
+
+        try:
+            job.result = target(job)
+            job.status = "completed"
+        except JobCancelled:
+            job.status = "cancelled"
+            print(f"⏹️ Job {job.kind} ({job.id}) cancelled")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"❌ Job {job.kind} ({job.id}) failed: {e}")
+        finally:
+            job.finished = time.time()
+            self.update(job)
@@ -0,0 +1,96 @@
+"""
+Library roots
+Finds screenshots under several root folders, recursively, and gives each
+file a stable id derived from its path
+"""
+
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def normalize_root(root: str) -> str:
+    return os.path.normpath(os.path.abspath(os.path.expanduser(root)))
+
+
+def stable_id(path: str) -> str:
+    """Same file path, same id - across rescans, reclassification and restarts"""
+    key = os.path.normcase(os.path.normpath(path))
+    return f"img_{hashlib.blake2b(key.encode('utf-8', 'surrogateescape'), digest_size=8).hexdigest()}"
+
+
+def root_of(path: str, roots: list) -> str | None:
+    """The library root containing path, if any"""
+    path = os.path.normcase(path)
+    for root in roots:
+        prefix = os.path.normcase(root).rstrip(os.sep) + os.sep
+        if path.startswith(prefix):
+            return root
+    return None
+
+
+def _scan_directory(path: str, is_supported) -> tuple:
+    """One os.scandir pass: (files, subdirectories) of a single directory"""
+    files = {}
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    # Symlinked directories are skipped so loops can't recurse forever
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            subdirs.append(entry.path)
+                    elif is_supported(entry.name) and entry.is_file():
+                        stat = entry.stat()
+                        files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    continue
+    except OSError as e:
+        print(f"⚠️ Could not read {path}: {e}")
+    return files, subdirs
+
+
+def walk_roots(roots: list, is_supported, workers: int = 8) -> dict:
+    """
+    path -> (mtime_ns, size) for every supported file under the roots
+    Directories are listed in parallel: os.scandir releases the GIL, which
+    matters most on network shares and spinning disks
+    """
+    files = {}
+    lock = threading.Lock()
+    done = threading.Condition(lock)
+    outstanding = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="scandir") as executor:
+        def submit(path):
+            nonlocal outstanding
+            with lock:
+                outstanding += 1
+            executor.submit(visit, path)
+
+        def visit(path):
+            nonlocal outstanding
+            try:
+                found, subdirs = _scan_directory(path, is_supported)
+                with lock:
+                    files.update(found)
+                for subdir in subdirs:
+                    submit(subdir)
+            finally:
+                with lock:
+                    outstanding -= 1
+                    done.notify_all()
+
+        for root in roots:
+            if os.path.isdir(root):
+                submit(root)
+            else:
+                print(f"❌ Folder not found: {root}")
+
+        with lock:
+            while outstanding:
+                done.wait()
+
+    return files
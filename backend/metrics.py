@@ -0,0 +1,268 @@
+"""
+Metrics and profiling
+Counters, gauges and latency histograms rendered in the Prometheus text
+format, optional JSON-lines timing logs, and an opt-in cProfile hook
+"""
+
+import os
+import json
+import time
+import bisect
+import cProfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Seconds; fine enough at the bottom for sub-millisecond stages like scoring
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+_timing_log = None
+_timing_log_lock = threading.Lock()
+_profile_dir = None
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        super().__init__(name, help_text, labels)
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def _samples(self) -> list:
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Metric):
+    """
+    Either set() directly or computed at scrape time by function, which
+    returns a number, or a dict of label tuple -> number for labelled gauges
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), function=None):
+        super().__init__(name, help_text, labels)
+        self.function = function
+        self.values = {}
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def _samples(self) -> list:
+        if self.function is not None:
+            try:
+                values = self.function()
+            except Exception:
+                return []
+            if values is None:
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self.lock:
+                values = dict(self.values)
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, seconds: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+        if _timing_log is not None:
+            _log_timing(self.name, labels, seconds)
+
+    def totals(self, **labels) -> tuple:
+        """(sum of observations, number of observations) for one label set"""
+        with self.lock:
+            series = self.series.get(self._key(labels))
+            return (series[1], series[2]) if series is not None else (0.0, 0)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> list:
+        with self.lock:
+            items = sorted((key, list(counts), total, count) for key, (counts, total, count) in self.series.items())
+
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def process_rss_bytes():
+    """Resident set size of this process, or None where it can't be read"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# Structured timing logs
+
+def configure_timing_log(path: str = None):
+    """Append one JSON line per histogram observation to path; None turns it off"""
+    global _timing_log
+    with _timing_log_lock:
+        if _timing_log is not None:
+            _timing_log.close()
+        _timing_log = open(path, "a", buffering=1) if path else None
+
+
+def _log_timing(metric: str, labels: dict, seconds: float):
+    line = json.dumps({"time": time.time(), "metric": metric, **labels, "seconds": round(seconds, 6)})
+    with _timing_log_lock:
+        if _timing_log is not None:
+            _timing_log.write(line + "\n")
+
+
+# Profiling
+
+def configure_profiling(directory: str = None):
+    """Write a cProfile .prof file for every operation() to directory; None turns it off"""
+    global _profile_dir
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    _profile_dir = directory
+
+
+OPERATION_SECONDS = Histogram(
+    "screenshot_operation_seconds",
+    "Duration of whole operations such as scans and ingest batches",
+    labels=("operation",)
+)
+
+
+@contextmanager
+def operation(name: str):
+    """
+    Time a top-level operation and, when profiling is on, profile it
+    cProfile only sees the calling thread; attach py-spy to the process
+    (its pid is in /api/health) to see the decode and thumbnail threads too
+    """
+    profiler = None
+    if _profile_dir is not None:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None  # Another operation is already being profiled
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        OPERATION_SECONDS.observe(time.perf_counter() - start, operation=name)
+        if profiler is not None:
+            profiler.disable()
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            profiler.dump_stats(os.path.join(_profile_dir, f"{name}-{stamp}-{threading.get_ident()}.prof"))
+
+
+# Classification pipeline metrics, shared by pipeline.py, classifier.py and server.py
+
+STAGE_SECONDS = Histogram(
+    "screenshot_stage_seconds",
+    "Per-image latency of each classification stage (forward is per batch)",
+    labels=("stage",)
+)
+MODEL_IMAGES = Counter("screenshot_model_images_total", "Images run through the vision model")
+CACHE_REQUESTS = Counter("screenshot_cache_requests_total", "Classification cache lookups", labels=("result",))
+FALLBACKS = Counter("screenshot_fallback_classifications_total", "Images classified by file name after the model failed")
+CLASSIFICATIONS = Counter("screenshot_classifications_total", "New classifications by outcome", labels=("result",))
+REJECTIONS = Counter("screenshot_rejections_total", "Images rejected as non-game, by reason", labels=("reason",))
+CASCADE_DECISIONS = Counter("screenshot_cascade_decisions_total", "Images decided by each classification tier", labels=("tier",))
+CASCADE_AUDITS = Counter(
+    "screenshot_cascade_audits_total",
+    "Pre-filter rejections re-checked by the model, by whether the model agreed",
+    labels=("result",)
+)
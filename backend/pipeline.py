@@ -0,0 +1,158 @@
+"""
+Image decode pipeline
+Reads and decodes images on a thread pool and feeds a bounded queue so that
+file I/O, decoding and model inference overlap
+"""
+
+import io
+import queue
+import hashlib
+import threading
+from PIL import Image
+from dedup import perceptual_hash
+from metrics import STAGE_SECONDS
+
+# CLIP only ever sees a 224px crop, so never decode much more than that
+TARGET_SIZE = 224
+
+_DONE = object()
+
+
+class DecodedImage:
+    """A preprocessed image ready for the model, or the error that prevented it"""
+    __slots__ = ("index", "path", "pixel_values", "size", "content_hash", "phash", "duplicate_of", "features", "error")
+
+    def __init__(self, index: int, path: str, pixel_values=None, size=None, content_hash=None, phash=None,
+                 features=None, error=None):
+        self.index = index
+        self.path = path
+        self.pixel_values = pixel_values
+        self.size = size
+        self.content_hash = content_hash
+        self.phash = phash
+        self.duplicate_of = None
+        self.features = features  # Pre-filter statistics, when the pipeline computes them
+        self.error = error
+
+
+def content_hash(data: bytes) -> str:
+    """Stable identifier for file contents, independent of name and mtime"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+# Modes whose pixels can be box-averaged; palette and bit-packed images are converted first
+_REDUCIBLE_MODES = {"L", "LA", "RGB", "RGBA", "RGBX", "CMYK", "YCbCr", "I", "F"}
+
+
+def decode_image(data: bytes, target_size: int = TARGET_SIZE) -> tuple:
+    """
+    Decode image bytes at the lowest resolution that still covers target_size
+    Returns (RGB image, original (width, height))
+    """
+    image = Image.open(io.BytesIO(data))
+    original_size = image.size
+
+    if image.format == "JPEG":
+        # Let libjpeg scale by 1/2, 1/4 or 1/8 while decoding
+        image.draft("RGB", (target_size, target_size))
+    elif getattr(image, "is_animated", False):
+        # Only the first frame matters; don't touch the rest of the GIF
+        image.seek(0)
+
+    if image.mode not in _REDUCIBLE_MODES:
+        image = image.convert("RGB")
+
+    # Cheap integer downscale for large PNG/WebP/BMP captures, before any
+    # conversion, so no full-resolution RGB copy is made
+    factor = min(image.size) // target_size
+    if factor >= 2:
+        image = image.reduce(factor)
+
+    return image.convert("RGB"), original_size
+
+
+class DecodePipeline:
+    """
+    Decode and preprocess images on worker threads
+    Workers block once the queue holds queue_size images, which bounds memory
+    to roughly queue_size preprocessed tensors plus one full decode per worker
+    """
+
+    def __init__(self, preprocess, workers: int = 4, queue_size: int = 64, target_size: int = TARGET_SIZE,
+                 analyze=None):
+        self.preprocess = preprocess
+        self.analyze = analyze  # Optional image -> features function, run on the decoded image
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.target_size = target_size
+
+    def decode(self, index: int, path: str) -> DecodedImage:
+        """Read, hash, decode and preprocess one file on the calling thread"""
+        try:
+            with STAGE_SECONDS.time(stage="read"):
+                with open(path, "rb") as f:
+                    data = f.read()
+            with STAGE_SECONDS.time(stage="decode"):
+                image, size = decode_image(data, self.target_size)
+            with STAGE_SECONDS.time(stage="preprocess"):
+                pixel_values = self.preprocess(image)
+            with STAGE_SECONDS.time(stage="hash"):
+                digest = content_hash(data)
+                phash = perceptual_hash(image)
+            features = None
+            if self.analyze is not None:
+                with STAGE_SECONDS.time(stage="prefilter"):
+                    features = self.analyze(image)
+            return DecodedImage(index, path, pixel_values, size, digest, phash, features)
+        except Exception as e:
+            return DecodedImage(index, path, error=e)
+
+    def batches(self, paths: list, batch_size: int):
+        """
+        Yield lists of up to batch_size DecodedImage items as they become ready
+        Items arrive in completion order; use item.index to map back to paths
+        """
+        decoded = queue.Queue(maxsize=self.queue_size)
+        pending = iter(enumerate(paths))
+        pending_lock = threading.Lock()
+        stop = threading.Event()
+
+        def worker():
+            while not stop.is_set():
+                with pending_lock:
+                    item = next(pending, None)
+                if item is None:
+                    break
+                decoded.put(self.decode(*item))
+            decoded.put(_DONE)
+
+        worker_count = min(self.workers, len(paths)) or 1
+        threads = [
+            threading.Thread(target=worker, name=f"decode-{i}", daemon=True)
+            for i in range(worker_count)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            finished = 0
+            batch = []
+            while finished < worker_count:
+                item = decoded.get()
+                if item is _DONE:
+                    finished += 1
+                    continue
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            # Unblock workers if the consumer stopped early
+            stop.set()
+            while any(thread.is_alive() for thread in threads):
+                try:
+                    decoded.get(timeout=0.1)
+                except queue.Empty:
+                    pass
@@ -0,0 +1,181 @@
+"""
+Cascade pre-filter
+Cheap statistics of a small copy of each image (colour entropy, flat
+background, text density, UI chrome) that reject obvious non-game
+captures - IDEs, terminals, browsers, documents - before CLIP runs.
+Anything it isn't sure about, and every game, still goes to the model
+"""
+
+import threading
+import numpy as np
+from PIL import Image
+from metrics import CASCADE_DECISIONS, CASCADE_AUDITS
+
+FEATURE_SIZE = 128
+BLOCK = 8
+
+
+def image_features(image: Image.Image) -> dict:
+    """Statistics of a FEATURE_SIZE square copy; nearest-neighbour keeps glyph edges and flat fills crisp"""
+    small = np.asarray(image.convert("RGB").resize((FEATURE_SIZE, FEATURE_SIZE), Image.NEAREST))
+    gray = small.mean(axis=2)
+
+    # Shannon entropy of a 12-bit colour histogram, scaled to 0-1
+    quantized = small >> 4
+    codes = (quantized[..., 0].astype(np.int32) << 8) | (quantized[..., 1].astype(np.int32) << 4) | quantized[..., 2]
+    counts = np.bincount(codes.ravel(), minlength=4096)
+    p = counts[counts > 0] / codes.size
+    entropy = float(-(p * np.log2(p)).sum() / 12)
+
+    # 8x8 blocks: flat fills, and text (sharp edges over a mostly solid background)
+    blocks = gray.reshape(FEATURE_SIZE // BLOCK, BLOCK, FEATURE_SIZE // BLOCK, BLOCK).transpose(0, 2, 1, 3)
+    blocks = blocks.reshape(-1, BLOCK * BLOCK)
+    flat = blocks.std(axis=1) < 3
+    levels = (blocks // 16).astype(np.int32)
+    background_share = np.array([np.bincount(row, minlength=16).max() for row in levels]) / (BLOCK * BLOCK)
+    sharp = (blocks.max(axis=1) - blocks.min(axis=1)) > 48
+    text = ~flat & sharp & (background_share >= 0.5)
+
+    # Full-width or full-height runs of one colour: toolbars, borders, panel edges
+    uniform_rows = gray.std(axis=1) < 2
+    uniform_cols = gray.std(axis=0) < 2
+
+    return {
+        "colourEntropy": entropy,
+        "dominantColour": float(counts.max() / codes.size),
+        "flatBlocks": float(flat.mean()),
+        "textBlocks": float(text.mean()),
+        "uniformLines": float((uniform_rows.sum() + uniform_cols.sum()) / (2 * FEATURE_SIZE))
+    }
+
+
+def nongame_score(features: dict) -> float:
+    """
+    0-1 confidence that an image is a UI, code or document capture
+    Without low colour entropy the score stays under 0.7, so photographic
+    and rendered game frames can't cross the default cutoff on layout alone
+    """
+    low_entropy = np.clip((0.55 - features["colourEntropy"]) / 0.35, 0, 1)
+    flat = np.clip((features["flatBlocks"] - 0.2) / 0.5, 0, 1)
+    text = np.clip(features["textBlocks"] / 0.3, 0, 1)
+    chrome = np.clip(features["uniformLines"] / 0.3, 0, 1)
+    return float(0.3 * low_entropy + 0.3 * flat + 0.25 * text + 0.15 * chrome)
+
+
+class Prefilter:
+    """
+    First tier of the cascade: decide() returns a score for images it can
+    reject on its own, None for images that need the model. A deterministic
+    sample of its rejections (audit_rate) also goes to the model, to measure
+    how often the two tiers agree
+    """
+
+    def __init__(self, reject_cutoff: float = 0.75, audit_rate: float = 0.05):
+        self.reject_cutoff = reject_cutoff
+        self.audit_rate = audit_rate
+        self.lock = threading.Lock()
+        self.decisions = {"prefilter": 0, "model": 0}
+        self.audits = {"agree": 0, "disagree": 0}
+
+    def decide(self, features: dict) -> float | None:
+        if features is None:
+            return None
+        score = nongame_score(features)
+        return score if score >= self.reject_cutoff else None
+
+    def should_audit(self, content_hash: str) -> bool:
+        """Chosen by content, so the same images are audited on every run"""
+        return int(content_hash[:8], 16) / 0xFFFFFFFF < self.audit_rate
+
+    def record(self, tier: str):
+        with self.lock:
+            self.decisions[tier] += 1
+        CASCADE_DECISIONS.inc(tier=tier)
+
+    def record_audit(self, model_result: dict):
+        result = "disagree" if model_result["isGameScreenshot"] else "agree"
+        with self.lock:
+            self.audits[result] += 1
+        CASCADE_AUDITS.inc(result=result)
+
+    def report(self) -> dict:
+        with self.lock:
+            total = sum(self.decisions.values())
+            audited = sum(self.audits.values())
+            return {
+                "rejectCutoff": self.reject_cutoff,
+                "decisions": dict(self.decisions),
+                "prefilterShare": self.decisions["prefilter"] / total if total else 0.0,
+                "audited": audited,
+                "agreement": self.audits["agree"] / audited if audited else None
+            }
+
+
+def evaluate(classifier, image_paths: list, cutoffs: list, batch_size: int = 16) -> list:
+    """
+    Run every image through both tiers and report, per cutoff, how many
+    images the pre-filter would have decided and how often the model agrees
+    classifier must have been created with a pre-filter, so features are computed
+    """
+    scores, model_says_game = [], []
+    prefilter, classifier.prefilter = classifier.prefilter, None  # Model decisions for every image
+    try:
+        for batch in classifier.pipeline.batches(image_paths, batch_size):
+            batch = [item for item in batch if item.error is None]
+            for item, result in zip(batch, classifier._classify_decoded(batch)):
+                scores.append(nongame_score(item.features))
+                model_says_game.append(result["isGameScreenshot"])
+    finally:
+        classifier.prefilter = prefilter
+
+    scores = np.array(scores)
+    model_says_game = np.array(model_says_game, dtype=bool)
+    reports = []
+    for cutoff in cutoffs:
+        rejected = scores >= cutoff
+        decided = int(rejected.sum())
+        reports.append({
+            "cutoff": cutoff,
+            "images": len(scores),
+            "prefilterDecided": decided,
+            "modelDecided": len(scores) - decided,
+            "prefilterShare": decided / len(scores) if len(scores) else 0.0,
+            "agreement": float((~model_says_game[rejected]).mean()) if decided else None,
+            "gamesRejected": int((model_says_game & rejected).sum())
+        })
+    return reports
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+    from classifier import GameScreenshotClassifier
+    from library import walk_roots
+
+    parser = argparse.ArgumentParser(description="How much of a sample the pre-filter decides, and how often CLIP agrees")
+    parser.add_argument("sample", nargs="+", help="Folders to sample images from (searched recursively)")
+    parser.add_argument("--cutoffs", default="0.6,0.65,0.7,0.75,0.8,0.85,0.9", help="Comma-separated reject cutoffs")
+    parser.add_argument("--limit", type=int, default=1000, help="Number of sample images")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    classifier = GameScreenshotClassifier(prefilter_cutoff=1.0)
+    classifier.initialize()
+
+    extensions = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif")
+    paths = sorted(walk_roots(args.sample, lambda name: name.lower().endswith(extensions)))[:args.limit]
+    print(f"\n🧪 Evaluating on {len(paths)} images...\n")
+
+    reports = evaluate(classifier, paths, [float(c) for c in args.cutoffs.split(",") if c.strip()])
+
+    print(f"{'cutoff':>7} {'prefilter':>10} {'share':>7} {'agree':>7} {'games lost':>11}")
+    for report in reports:
+        agreement = f"{report['agreement']:.2%}" if report["agreement"] is not None else "-"
+        print(
+            f"{report['cutoff']:>7} {report['prefilterDecided']:>10} {report['prefilterShare']:>7.1%} "
+            f"{agreement:>7} {report['gamesRejected']:>11}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
@@ -0,0 +1,115 @@
+"""
+Response cache
+Serialized JSON bodies for read endpoints, kept per query and per data
+version, with gzip (and brotli, when installed) variants compressed once
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CachedBody:
+    """One serialized response; encoded variants are added the first time they are asked for"""
+    __slots__ = ("version", "body", "etag", "encoded")
+
+    def __init__(self, version, body: bytes):
+        self.version = version
+        self.body = body
+        # Content-derived, so a rebuild that produces the same bytes keeps the same ETag
+        self.etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.encoded = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(data) for data in self.encoded.values())
+
+
+class ResponseCache:
+    """
+    LRU of CachedBody by key (path + query), bounded by total bytes
+    An entry whose version no longer matches the data's is rebuilt on its next request
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, min_compress_size: int = 1024,
+                 gzip_level: int = 6, brotli_quality: int = 5):
+        self.max_bytes = max_bytes
+        self.min_compress_size = min_compress_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    @property
+    def encodings(self) -> list:
+        """Content codings this cache can produce, preferred first"""
+        return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+    def get(self, key, version) -> CachedBody | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, body: bytes) -> CachedBody:
+        entry = CachedBody(version, body)
+        with self.lock:
+            self._discard(key)
+            if entry.size <= self.max_bytes:
+                self.entries[key] = entry
+                self.total_bytes += entry.size
+                self._evict()
+        return entry
+
+    def encode(self, key, entry: CachedBody, accept_encodings) -> tuple:
+        """
+        (content coding or None, bytes) of entry for a request's Accept-Encoding
+        Small bodies go out uncompressed; the framing would eat the saving
+        """
+        if len(entry.body) < self.min_compress_size:
+            return None, entry.body
+        encoding = accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return None, entry.body
+
+        data = entry.encoded.get(encoding)
+        if data is None:
+            if encoding == "br":
+                data = brotli.compress(entry.body, quality=self.brotli_quality)
+            else:
+                data = gzip.compress(entry.body, compresslevel=self.gzip_level, mtime=0)
+            with self.lock:
+                if encoding not in entry.encoded:
+                    entry.encoded[encoding] = data
+                    if self.entries.get(key) is entry:
+                        self.total_bytes += len(data)
+                        self._evict()
+        return encoding, data
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.total_bytes}
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            _, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry.size
@@ -0,0 +1,110 @@
+"""
+Natural-language search over stored image embeddings
+Scores a CLIP text query against every embedding with one matrix-vector
+product and selects the top-k with a partial sort
+"""
+
+import threading
+from functools import lru_cache
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+class SemanticSearch:
+    """
+    Keeps a float32 copy of the embedding store for fast BLAS scoring and,
+    when hnswlib is installed and enabled, an approximate nearest-neighbour
+    index for very large libraries
+    """
+
+    def __init__(self, classifier, embedding_store, query_cache_size: int = 256,
+                 use_ann: bool = False, ann_min_size: int = 200_000):
+        self.classifier = classifier
+        self.embedding_store = embedding_store
+        self.lock = threading.Lock()
+        self.buffer = np.zeros((0, embedding_store.dim), dtype=np.float32)
+        self.count = 0
+        self.use_ann = use_ann and hnswlib is not None
+        self.ann_min_size = ann_min_size
+        self.ann_index = None
+        self.ann_count = 0
+
+        # Repeated queries (typing, paging) skip the text encoder entirely
+        self.encode_query = lru_cache(maxsize=query_cache_size)(self._encode_query)
+
+    def _encode_query(self, text: str) -> np.ndarray:
+        embedding = self.classifier.encode_text(text)
+        embedding.setflags(write=False)
+        return embedding
+
+    def _sync(self):
+        """Pull rows appended to the embedding store since the last search"""
+        stored = len(self.embedding_store)
+        if stored == self.count:
+            return
+
+        # Grow geometrically so a stream of new images doesn't copy the matrix each time
+        if stored > len(self.buffer):
+            buffer = np.empty((max(stored, len(self.buffer) * 2), self.buffer.shape[1]), dtype=np.float32)
+            buffer[:self.count] = self.buffer[:self.count]
+            self.buffer = buffer
+        self.buffer[self.count:stored] = self.embedding_store.matrix()[self.count:stored]
+        self.count = stored
+
+        if self.use_ann and stored >= self.ann_min_size:
+            if self.ann_index is None:
+                self.ann_index = hnswlib.Index(space="ip", dim=self.buffer.shape[1])
+                self.ann_index.init_index(max_elements=stored * 2, ef_construction=200, M=16)
+                self.ann_index.set_ef(128)
+            elif stored > self.ann_index.get_max_elements():
+                self.ann_index.resize_index(stored * 2)
+            self.ann_index.add_items(self.buffer[self.ann_count:stored], np.arange(self.ann_count, stored))
+            self.ann_count = stored
+
+    def search(self, query: str, candidate_rows: np.ndarray, k: int) -> list:
+        """
+        Return [(row, score), ...] for the k best rows among candidate_rows
+        candidate_rows are embedding store rows of images currently in the gallery
+        """
+        if k <= 0 or len(candidate_rows) == 0:
+            return []
+
+        query_embedding = self.encode_query(query)
+
+        with self.lock:
+            self._sync()
+
+            if self.ann_index is not None:
+                return self._search_ann(query_embedding, candidate_rows, k)
+
+            matrix = self.buffer[:self.count]
+            if len(candidate_rows) * 4 < self.count:
+                # Gallery is a small slice of the store: only score the candidates
+                scores = matrix[candidate_rows] @ query_embedding
+            else:
+                scores = (matrix @ query_embedding)[candidate_rows]
+
+        k = min(k, len(scores))
+        # O(n) selection of the top k, then sort only those k
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidate_rows[i]), float(scores[i])) for i in top]
+
+    def _search_ann(self, query_embedding: np.ndarray, candidate_rows: np.ndarray, k: int) -> list:
+        """Approximate search; over-fetch because some neighbours aren't in the gallery"""
+        allowed = set(candidate_rows.tolist())
+        fetch = min(self.ann_count, k * 4)
+        while True:
+            labels, distances = self.ann_index.knn_query(query_embedding, k=fetch)
+            hits = [
+                (int(row), 1.0 - float(distance))
+                for row, distance in zip(labels[0], distances[0])
+                if int(row) in allowed
+            ]
+            if len(hits) >= k or fetch >= self.ann_count:
+                return hits[:k]
+            fetch = min(self.ann_count, fetch * 4)
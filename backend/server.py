@@ -6,61 +6,404 @@ Uses CLIP for accurate game screenshot classification
 import os
 import json
 import time
+import uuid
+import base64
 import hashlib
-from pathlib import Path
+import threading
+from collections import deque
+import numpy as np
 from datetime import datetime
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, jsonify, request, send_file
 from flask_cors import CORS
 from flask_socketio import SocketIO
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from classifier import GameScreenshotClassifier
+from cache_store import open_cache_store, migrate_json_cache
+from embedding_store import EmbeddingStore
+from search import SemanticSearch
+from dedup import PerceptualIndex, cluster_by_embedding
+from thumbnails import ThumbnailService
+from ingest import IngestQueue
+from jobs import JobManager
+from gallery import GalleryIndex, Screenshot
+from response_cache import ResponseCache
+from broadcast import ChangeBroadcaster
+from library import normalize_root, stable_id, root_of, walk_roots
+import metrics
+from metrics import CACHE_REQUESTS, CLASSIFICATIONS, REJECTIONS
 
 # Configuration
 CONFIG = {
-    "SCREENSHOTS_FOLDER": r"C:\Users\Jeet\Pictures\Screenshots",
+    "LIBRARY_ROOTS": [r"C:\Users\Jeet\Pictures\Screenshots"],  # Scanned and watched recursively
+    "SCAN_WORKERS": 8,  # Directories listed in parallel during a scan
     "PORT": 3001,
     "SUPPORTED_EXTENSIONS": {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif"},
-    "CACHE_FILE": "classification_cache.json"
+    "CACHE_BACKEND": "sqlite",  # "sqlite" or "json"
+    "CACHE_DB": "classification_cache.db",
+    "CACHE_FILE": "classification_cache.json",  # Legacy cache, migrated on first start
+    "EMBEDDINGS_DIR": "embeddings",
+    "SEARCH_ANN": False,  # Approximate search via hnswlib for very large libraries
+    "SEARCH_ANN_MIN_SIZE": 200000,
+    "DUPLICATE_HASH_DISTANCE": 4,  # dHash bits; near-identical files skip the model
+    "DUPLICATE_SIMILARITY": 0.97,  # Embedding cosine similarity for burst clusters
+    "DUPLICATE_WINDOW": 32,  # Neighbours (by date) compared when clustering
+    "THUMBNAIL_DIR": "thumbnails",
+    "THUMBNAIL_WIDTHS": (320, 640),
+    "THUMBNAIL_FORMAT": "webp",  # "webp" or "jpeg"
+    "THUMBNAIL_CACHE_BYTES": 2 * 1024 ** 3,
+    "THUMBNAIL_WORKERS": 2,
+    "X_SENDFILE": False,  # Let a fronting nginx/Apache send originals (X-Sendfile header) instead of Python
+    "RESPONSE_CACHE_BYTES": 64 * 1024 ** 2,  # Serialized /api responses, with their gzip/brotli variants
+    "CHANGELOG_SIZE": 5000,  # Clients further behind than this get a resync
+    "BROADCAST_WINDOW": 0.25,  # Seconds of gallery changes coalesced into one screenshotsChanged event
+    "BROADCAST_MAX_CHANGES": 200,  # Bigger batches only tell clients to fetch /api/screenshots/changes
+    "BROADCAST_MAX_UNACKED": 8,  # Batches a client may leave unacknowledged before it is switched to a resync
+    "BROADCAST_FIELDS": ["id", "url", "title", "game", "category", "confidence",
+                         "dateAdded", "fileSize", "thumbnailUrl", "thumbnails"],  # What the gallery cards render
+    "INGEST_WORKERS": 1,
+    "INGEST_MAX_PENDING": 1000,  # Observer blocks once this many files are queued
+    "INGEST_SETTLE_SECONDS": 0.5,  # Size/mtime must be unchanged this long
+    "INFERENCE_BACKEND": "fp32",  # "fp32", "int8", "compile", "torchscript" or "onnx"; compare with inference.py
+    "INFERENCE_THREADS": None,  # Intra-op threads (None = PyTorch default)
+    "INFERENCE_INTEROP_THREADS": None,
+    "INFERENCE_WORKERS": 0,  # >0 runs the vision encoder in that many processes (threads are split between them)
+    "PREFILTER_CUTOFF": None,  # Cascade pre-filter reject cutoff, e.g. 0.75 (None = every image goes to CLIP); see prefilter.py
+    "PREFILTER_AUDIT_RATE": 0.05,  # Share of pre-filter rejections also checked by CLIP, for the agreement figure
+    "MODEL_CACHE_DIR": "models",  # Exported ONNX graphs
+    "TIMING_LOG": None,  # Path for JSON-lines stage timings, e.g. "timings.jsonl"
+    "PROFILE_DIR": None,  # Directory for cProfile dumps of each scan/ingest batch
+    "BATCH_SIZE": 16,
+    "DECODE_WORKERS": 4,
+    "DECODE_QUEUE_SIZE": 64
 }
 
 # Initialize Flask
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:5173", "http://127.0.0.1:5173"])
 socketio = SocketIO(app, cors_allowed_origins="*")
+app.config["USE_X_SENDFILE"] = CONFIG["X_SENDFILE"]
 
 # Global state
 classifier = None
+cache_store = None
+embedding_store = None
+search_index = None
+duplicate_index = None
+thumbnail_service = None
+ingest_queue = None
+startup_job = None
+startup_status = {"cache": False, "model": False, "scan": False}  # Stages finished so far
+started_at = time.time()
 classification_cache = {}
-game_screenshots = []
+file_index = {}  # path -> (mtime_ns, size) as of the last completed scan
+change_epoch = uuid.uuid4().hex[:12]  # Changes to a new epoch after restarts
+change_seq = 0
+changelog = deque(maxlen=CONFIG["CHANGELOG_SIZE"])
+changes_lock = threading.Lock()
+# The game screenshots on show; its lock serialises watcher updates, the rescan swap and readers
+gallery = GalleryIndex(on_change=lambda op, screenshot: record_change(op, screenshot))
+broadcaster = ChangeBroadcaster(
+    socketio,
+    change_epoch,
+    window=CONFIG["BROADCAST_WINDOW"],
+    max_changes=CONFIG["BROADCAST_MAX_CHANGES"],
+    max_unacked=CONFIG["BROADCAST_MAX_UNACKED"],
+    fields=CONFIG["BROADCAST_FIELDS"]
+)
+response_cache = ResponseCache(max_bytes=CONFIG["RESPONSE_CACHE_BYTES"])
+_search_candidates = (None, None, None)
+_duplicate_labels = (None, None)
 
 
 def load_cache():
-    """Load classification cache from file"""
-    global classification_cache
+    """Open the cache store and load classifications into memory"""
+    global cache_store, classification_cache
     try:
-        if os.path.exists(CONFIG["CACHE_FILE"]):
-            with open(CONFIG["CACHE_FILE"], "r") as f:
-                classification_cache = json.load(f)
-            print(f"📁 Loaded {len(classification_cache)} cached classifications")
+        if CONFIG["CACHE_BACKEND"] == "json":
+            cache_store = open_cache_store("json", CONFIG["CACHE_FILE"])
+        else:
+            cache_store = open_cache_store(CONFIG["CACHE_BACKEND"], CONFIG["CACHE_DB"])
+            try:
+                migrated = migrate_json_cache(cache_store, CONFIG["CACHE_FILE"])
+                if migrated:
+                    print(f"📦 Migrated {migrated} classifications from {CONFIG['CACHE_FILE']}")
+            except Exception as e:
+                print(f"⚠️ Could not migrate {CONFIG['CACHE_FILE']}, leaving it in place: {e}")
+        
+        classification_cache = cache_store.load_all()
+        print(f"📁 Loaded {len(classification_cache)} cached classifications")
+        upgraded = upgrade_cache()
+        if upgraded:
+            print(f"📦 Re-keyed {upgraded} classifications by full path")
     except Exception as e:
         print(f"⚠️ Could not load cache: {e}")
         classification_cache = {}
 
 
+def upgrade_cache() -> int:
+    """
+    Older caches were keyed by bare file name and used per-run ids; re-key
+    them by full path and give them stable ids instead of reclassifying
+    """
+    stale = []
+    for cache_key, result in list(classification_cache.items()):
+        path = result.get("filePath")
+        if not path:
+            continue
+        new_key = cache_key_for(path, cache_key.rsplit("_", 1)[-1])
+        # Records from before versioned original URLs get one too
+        if new_key != cache_key or result.get("id") != stable_id(path) or "?v=" not in result.get("url", ""):
+            stale.append((cache_key, new_key, result))
+    
+    for cache_key, new_key, result in stale:
+        del classification_cache[cache_key]
+        if cache_store is not None and new_key != cache_key:
+            cache_store.delete(cache_key)
+        
+        result = {k: v for k, v in result.items() if k not in ("thumbnails", "thumbnailUrl")}
+        result.update(record_identity(result["filePath"], cache_key.rsplit("_", 1)[-1], result.get("fileSize")))
+        cache_put(new_key, result)
+    
+    if stale:
+        save_cache()
+    return len(stale)
+
+
+def restore_gallery() -> int:
+    """
+    Rebuild the gallery from the cache alone, without the model or any file
+    access; the startup scan then reconciles it with what is on disk
+    """
+    global file_index
+    latest = {}  # path -> (mtime_ns, result) of its newest cache entry
+    for cache_key, result in list(classification_cache.items()):
+        path = result.get("filePath")
+        mtime_ns = cache_key.rsplit("_", 1)[-1]
+        if not path or not mtime_ns.isdigit():
+            continue
+        mtime_ns = int(mtime_ns)
+        if path not in latest or mtime_ns > latest[path][0]:
+            latest[path] = (mtime_ns, result)
+    
+    roots = library_roots()
+    records = []
+    index = {}
+    for path, (mtime_ns, result) in latest.items():
+        if root_of(path, roots) is None:
+            continue  # Its root was removed from LIBRARY_ROOTS
+        # Lets the startup scan skip every file that hasn't changed since
+        index[path] = (mtime_ns, result.get("fileSize"))
+        if result["isGameScreenshot"]:
+            ensure_thumbnails(result)
+            records.append(result)
+    
+    with gallery.lock:
+        gallery.replace_all(records)
+        file_index = index
+    return len(records)
+
+
+def cache_put(cache_key: str, result: dict):
+    """Store a classification in memory and stage it for the next save_cache()"""
+    classification_cache[cache_key] = result
+    if cache_store is not None:
+        try:
+            cache_store.put(cache_key, result)
+        except Exception as e:
+            print(f"⚠️ Could not write cache entry: {e}")
+
+
 def save_cache():
-    """Save classification cache to file"""
+    """Commit staged cache entries to disk"""
     try:
-        with open(CONFIG["CACHE_FILE"], "w") as f:
-            json.dump(classification_cache, f, indent=2)
+        if cache_store is not None:
+            cache_store.commit()
     except Exception as e:
         print(f"⚠️ Could not save cache: {e}")
 
 
+def sort_key(screenshot: dict) -> tuple:
+    """Gallery order key; the gallery is shown in descending order of this"""
+    return (screenshot["dateAdded"], screenshot["id"])
+
+
+def find_position(screenshots: list, key: tuple) -> int:
+    """Binary search of a newest-first list: index of the first screenshot older than key"""
+    lo, hi = 0, len(screenshots)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if sort_key(screenshots[mid]) >= key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def record_change(op: str, screenshot: dict):
+    """Append an add/update/remove to the changelog under the next sequence number, and queue it for clients"""
+    global change_seq
+    with changes_lock:
+        change_seq += 1
+        changelog.append((change_seq, op, screenshot))
+        broadcaster.publish(change_seq, op, screenshot)
+
+
+def changes_since(since: int):
+    """Changes after since, or None if the changelog no longer reaches back that far"""
+    with changes_lock:
+        if since > change_seq:
+            return None
+        if since < change_seq and (not changelog or changelog[0][0] > since + 1):
+            return None
+        return [change for change in changelog if change[0] > since]
+
+
+def encode_cursor(screenshot: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(sort_key(screenshot)).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Inverse of encode_cursor; ValueError for anything that isn't a (timestamp, id) pair of strings"""
+    value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not (isinstance(value, list) and len(value) == 2 and all(isinstance(part, str) for part in value)):
+        raise ValueError("cursor is not a (timestamp, id) pair")
+    return tuple(value)
+
+
+def derived_version() -> tuple:
+    """
+    Version of state derived from the gallery and the embedding store together
+    The store's size counts too: a rescan after clear-cache refills it without changing any record
+    """
+    return gallery.version, len(embedding_store) if embedding_store is not None else 0
+
+
+def search_candidates() -> tuple:
+    """Embedding rows and row -> record map for the gallery, rebuilt only after changes"""
+    global _search_candidates
+    version, rows, records = _search_candidates
+    if version != derived_version():
+        version = derived_version()
+        records = {}
+        for s in gallery.page():
+            row = embedding_store.rows.get(s.get("contentHash"))
+            if row is not None:
+                records[row] = s
+        rows = np.fromiter(records.keys(), dtype=np.int64, count=len(records))
+        _search_candidates = (version, rows, records)
+    return rows, records
+
+
+def duplicate_labels() -> dict:
+    """Cluster label per screenshot id, grouping near-identical images; rebuilt only after changes"""
+    global _duplicate_labels
+    version, labels = _duplicate_labels
+    if version == derived_version():
+        return labels
+    
+    version = derived_version()
+    labels = {}
+    members, rows = [], []
+    for s in gallery.page():
+        row = embedding_store.rows.get(s.get("contentHash")) if embedding_store is not None else None
+        if row is None:
+            labels[s["id"]] = s["id"]
+        else:
+            members.append(s["id"])
+            rows.append(row)
+    
+    if rows:
+        # The gallery is newest first, so bursts are adjacent
+        embeddings = np.asarray(embedding_store.matrix()[rows], dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        clusters = cluster_by_embedding(
+            embeddings,
+            threshold=CONFIG["DUPLICATE_SIMILARITY"],
+            window=CONFIG["DUPLICATE_WINDOW"]
+        )
+        for screenshot_id, cluster in zip(members, clusters):
+            labels[screenshot_id] = members[cluster]
+    
+    _duplicate_labels = (version, labels)
+    return labels
+
+
+def collapse_duplicates(screenshots: list) -> list:
+    """Keep the newest screenshot of each duplicate cluster, with a duplicateCount"""
+    labels = duplicate_labels()
+    representatives = {}
+    counts = {}
+    
+    for s in screenshots:
+        label = labels.get(s["id"], s["id"])
+        if label not in representatives:
+            representatives[label] = s
+            counts[label] = 0
+        counts[label] += 1
+    
+    return [
+        {**s, "duplicateCount": counts[label]}
+        for label, s in representatives.items()
+    ]
+
+
+def thumbnail_key(result: dict) -> str:
+    """Identifies the image contents, so thumbnails can be cached forever"""
+    if result.get("contentHash"):
+        return result["contentHash"]
+    source = f"{result['filePath']}_{result['dateAdded']}_{result['fileSize']}"
+    return hashlib.md5(source.encode()).hexdigest()
+
+
+def ensure_thumbnails(result: dict):
+    """Attach thumbnail URLs to a gallery record and render missing thumbnails in the background"""
+    key = thumbnail_key(result)
+    if "thumbnailUrl" not in result:
+        urls = {
+            str(width): f"/thumbnails/{result['id']}?w={width}&v={key[:12]}"
+            for width in CONFIG["THUMBNAIL_WIDTHS"]
+        }
+        result["thumbnails"] = urls
+        result["thumbnailUrl"] = urls[str(min(CONFIG["THUMBNAIL_WIDTHS"]))]
+    
+    if thumbnail_service is not None:
+        thumbnail_service.submit(result["filePath"], key)
+
+
 def get_cache_key(filepath: str) -> str:
     """Generate cache key from file path and modification time"""
     stat = os.stat(filepath)
-    return f"{os.path.basename(filepath)}_{stat.st_mtime_ns}"
+    return cache_key_for(filepath, stat.st_mtime_ns)
+
+
+def cache_key_for(filepath: str, mtime_ns: int) -> str:
+    """get_cache_key for an already-known mtime"""
+    return f"{filepath}_{mtime_ns}"
+
+
+def file_version(filepath: str, mtime_ns, size) -> str:
+    """Strong validator for a file's bytes, from the mtime its cache key uses plus its size"""
+    key = f"{cache_key_for(filepath, mtime_ns)}_{size}"
+    return hashlib.blake2b(key.encode("utf-8", "surrogateescape"), digest_size=8).hexdigest()
+
+
+def library_roots() -> list:
+    return [normalize_root(root) for root in CONFIG["LIBRARY_ROOTS"]]
+
+
+def record_identity(filepath: str, mtime_ns, size) -> dict:
+    """
+    The parts of a screenshot record derived from where the file lives
+    The url names this version of the file, so its response can be cached as immutable
+    """
+    screenshot_id = stable_id(filepath)
+    root = root_of(filepath, library_roots())
+    folder = os.path.relpath(os.path.dirname(filepath), root) if root else ""
+    return {
+        "id": screenshot_id,
+        "url": f"/screenshots/{screenshot_id}?v={file_version(filepath, mtime_ns, size)}",
+        "folder": "" if folder == "." else folder.replace(os.sep, "/")
+    }
 
 
 def generate_title(filename: str) -> str:
@@ -91,169 +434,570 @@ def generate_title(filename: str) -> str:
     return title.title()
 
 
-def classify_file(filepath: str) -> dict | None:
-    """Classify a single file and return result"""
-    global classification_cache
-    
+def build_result(filepath: str, classification: dict) -> dict:
+    """Build a screenshot record from a classifier result"""
     filename = os.path.basename(filepath)
-    cache_key = get_cache_key(filepath)
+    stat = os.stat(filepath)
     
-    # Check cache
-    if cache_key in classification_cache:
-        return classification_cache[cache_key]
+    return {
+        **record_identity(filepath, stat.st_mtime_ns, stat.st_size),
+        "fileName": filename,
+        "filePath": filepath,
+        "title": generate_title(filename),
+        **classification_fields(classification),
+        "dateAdded": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+        "fileSize": stat.st_size
+    }
+
+
+def classification_fields(classification: dict) -> dict:
+    """The parts of a screenshot record that come from the classifier"""
+    return {
+        "game": classification["detectedGame"],
+        "category": classification["category"],
+        "confidence": classification["confidence"],
+        "isGameScreenshot": classification["isGameScreenshot"],
+        "gameScore": classification["gameScore"],
+        "nonGameScore": classification["nonGameScore"],
+        "animeScore": classification.get("animeScore", 0),
+        "codeScore": classification.get("codeScore", 0),
+        "topPredictions": classification["topPredictions"],
+        "resolution": classification.get("resolution", "unknown"),
+        "contentHash": classification.get("contentHash"),
+        "perceptualHash": classification.get("perceptualHash"),
+        "duplicateOf": classification.get("duplicateOf"),
+        "tier": classification.get("tier")
+    }
+
+
+def rejection_reason(result: dict) -> str:
+    """Main reason a non-game image was rejected: prefilter, anime, code or other"""
+    if result.get("tier") == "prefilter":
+        return "prefilter"
+    if result.get("animeScore", 0) > 0.2:
+        return "anime"
+    if result.get("codeScore", 0) > 0.2:
+        return "code"
+    return "other"
+
+
+def count_classification(result: dict):
+    if result["isGameScreenshot"]:
+        CLASSIFICATIONS.inc(result="game")
+    else:
+        CLASSIFICATIONS.inc(result="rejected")
+        REJECTIONS.inc(reason=rejection_reason(result))
+
+
+def classify_files(filepaths: list) -> list:
+    """
+    Classify many files, sending cache misses through the model in batches
+    Returns one result (or None on error) per path, in order
+    """
+    results = [None] * len(filepaths)
+    misses = []
+    hits = 0
     
-    try:
-        # Classify with ML
-        classification = classifier.classify_image(filepath)
-        
-        stat = os.stat(filepath)
-        
-        result = {
-            "id": f"img_{int(time.time() * 1000)}_{hashlib.md5(filename.encode()).hexdigest()[:8]}",
-            "fileName": filename,
-            "filePath": filepath,
-            "url": f"/screenshots/{filename}",
-            "title": generate_title(filename),
-            "game": classification["detectedGame"],
-            "category": classification["category"],
-            "confidence": classification["confidence"],
-            "isGameScreenshot": classification["isGameScreenshot"],
-            "gameScore": classification["gameScore"],
-            "nonGameScore": classification["nonGameScore"],
-            "animeScore": classification.get("animeScore", 0),
-            "codeScore": classification.get("codeScore", 0),
-            "topPredictions": classification["topPredictions"],
-            "dateAdded": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-            "fileSize": stat.st_size,
-            "resolution": classification.get("resolution", "unknown")
-        }
+    for i, filepath in enumerate(filepaths):
+        try:
+            cache_key = get_cache_key(filepath)
+        except OSError as e:
+            print(f"❌ Error reading {os.path.basename(filepath)}: {e}")
+            continue
         
-        # Cache the result
-        classification_cache[cache_key] = result
-        save_cache()
-        
-        return result
+        cached = classification_cache.get(cache_key)
+        if cached is not None:
+            results[i] = cached
+            hits += 1
+        else:
+            misses.append((i, filepath, cache_key))
+    
+    CACHE_REQUESTS.inc(hits, result="hit")
+    CACHE_REQUESTS.inc(len(misses), result="miss")
+    if not misses:
+        return results
+    
+    classifications = classifier.classify_images(
+        [filepath for _, filepath, _ in misses],
+        batch_size=CONFIG["BATCH_SIZE"]
+    )
+    
+    for (i, filepath, cache_key), classification in zip(misses, classifications):
+        try:
+            result = build_result(filepath, classification)
+        except Exception as e:
+            print(f"❌ Error classifying {os.path.basename(filepath)}: {e}")
+            continue
         
-    except Exception as e:
-        print(f"❌ Error classifying {filename}: {e}")
-        return None
+        cache_put(cache_key, result)
+        count_classification(result)
+        results[i] = result
+    
+    # One commit per chunk instead of one per file
+    save_cache()
+    
+    return results
 
 
-def scan_existing_files():
-    """Scan folder for existing screenshots"""
-    global game_screenshots
+def scan_existing_files(job=None, full: bool = False) -> dict:
+    """
+    Bring the gallery in line with the library roots
+    Only files added or changed since the last scan are classified (all of
+    them with full=True). The live list is swapped in once at the end, so
+    clients keep seeing the old gallery while a scan runs
+    """
+    global file_index
     
     print("📂 Scanning existing files...")
     
-    folder = Path(CONFIG["SCREENSHOTS_FOLDER"])
-    if not folder.exists():
-        print(f"❌ Folder not found: {folder}")
-        return
+    listing = walk_roots(library_roots(), is_supported, workers=CONFIG["SCAN_WORKERS"])
+    previous = gallery.snapshot()
     
-    image_files = [
-        f for f in folder.iterdir()
-        if f.suffix.lower() in CONFIG["SUPPORTED_EXTENSIONS"]
-    ]
+    added = [path for path in listing if path not in file_index]
+    changed = [path for path, signature in listing.items() if path in file_index and file_index[path] != signature]
+    to_process = list(listing) if full else added + changed
     
-    print(f"Found {len(image_files)} images to process\n")
+    counters = {
+        "total": len(listing),
+        "added": len(added),
+        "changed": len(changed),
+        "removed": sum(1 for path in file_index if path not in listing),
+        "processed": 0,
+        "toProcess": len(to_process),
+        "games": 0,
+        "rejected": {"prefilter": 0, "anime": 0, "code": 0, "other": 0}
+    }
+    if job is not None:
+        job.counters = counters
+        job_manager.update(job)
     
-    game_screenshots = []
-    processed = 0
-    game_count = 0
-    rejected = {"anime": 0, "code": 0, "other": 0}
+    print(f"Found {len(listing)} images, {len(to_process)} to process\n")
     
-    for filepath in image_files:
-        result = classify_file(str(filepath))
-        
+    new_gallery = []
+    rejected = counters["rejected"]
+    
+    def tally(result):
+        if result["isGameScreenshot"]:
+            ensure_thumbnails(result)
+            new_gallery.append(result)
+            counters["games"] += 1
+        else:
+            # Track rejection reasons
+            rejected[rejection_reason(result)] += 1
+    
+    # Unchanged files keep their current entry without touching the model or the disk
+    process_set = set(to_process)
+    for path, (mtime_ns, _) in listing.items():
+        if path in process_set:
+            continue
+        result = gallery.get_by_path(path) or classification_cache.get(cache_key_for(path, mtime_ns))
         if result:
-            if result["isGameScreenshot"]:
-                game_screenshots.append(result)
-                game_count += 1
-            else:
-                # Track rejection reasons
-                if result.get("animeScore", 0) > 0.2:
-                    rejected["anime"] += 1
-                elif result.get("codeScore", 0) > 0.2:
-                    rejected["code"] += 1
-                else:
-                    rejected["other"] += 1
+            tally(result)
+    
+    # Classify in chunks so progress is reported (and cancellation checked) during long scans
+    chunk_size = CONFIG["BATCH_SIZE"] * 4
+    
+    for start in range(0, len(to_process), chunk_size):
+        if job is not None:
+            job.check_cancelled()
+        
+        results = classify_files(to_process[start:start + chunk_size])
         
-        processed += 1
-        if processed % 25 == 0 or processed == len(image_files):
-            print(f"Progress: {processed}/{len(image_files)} | Games: {game_count} | Rejected - Anime: {rejected['anime']}, Code: {rejected['code']}, Other: {rejected['other']}")
+        for result in results:
+            if result:
+                tally(result)
+            
+            counters["processed"] += 1
+            processed = counters["processed"]
+            if processed % 25 == 0 or processed == len(to_process):
+                print(f"Progress: {processed}/{len(to_process)} | Games: {counters['games']} | Rejected - Pre-filter: {rejected['prefilter']}, Anime: {rejected['anime']}, Code: {rejected['code']}, Other: {rejected['other']}")
+                if job is not None:
+                    job_manager.update(job)
     
-    # Sort by date (newest first)
-    game_screenshots.sort(key=lambda x: x["dateAdded"], reverse=True)
+    if job is not None:
+        job.check_cancelled()
+    
+    with gallery.lock:
+        # Whatever the watcher added, updated or removed while we were scanning is newer than the scan
+        live = gallery.snapshot()
+        touched = {i for i in previous.keys() | live.keys() if live.get(i) is not previous.get(i)}
+        new_gallery = [s for s in new_gallery if s["id"] not in touched]
+        new_gallery.extend(live[i] for i in touched if i in live)
+        
+        # Their listing signatures may predate the watcher's change; the next scan checks them again
+        index = dict(listing)
+        for i in touched:
+            index.pop((live.get(i) or previous[i])["filePath"], None)
+        
+        # Swap in the new gallery and log what changed
+        gallery.replace_all(new_gallery)
+        file_index = index
     
     print(f"\n✅ Scan complete!")
-    print(f"   Game screenshots: {game_count}")
+    print(f"   Game screenshots: {counters['games']}")
+    print(f"   Rejected (Pre-filter): {rejected['prefilter']}")
     print(f"   Rejected (Anime/Manga): {rejected['anime']}")
     print(f"   Rejected (Code/IDE): {rejected['code']}")
     print(f"   Rejected (Other): {rejected['other']}")
     print()
+    
+    return counters
+
+
+def build_duplicate_index() -> PerceptualIndex:
+    """Perceptual hashes of every cached image that was actually run through the model"""
+    index = PerceptualIndex(max_distance=CONFIG["DUPLICATE_HASH_DISTANCE"])
+    seen = set()
+    
+    for result in list(classification_cache.values()):
+        content_hash = result.get("contentHash")
+        if result.get("perceptualHash") and content_hash and not result.get("duplicateOf") and content_hash not in seen:
+            seen.add(content_hash)
+            index.add(int(result["perceptualHash"], 16), content_hash)
+    
+    return index
+
+
+def reclassify_cache() -> dict:
+    """
+    Re-derive every cached classification from stored image embeddings
+    Only the prompt matmul runs, so this takes seconds rather than a full rescan
+    """
+    keys, hashes, sizes = [], [], []
+    missing = 0
+    
+    # Over a snapshot: ingest workers keep adding entries while this job runs
+    for cache_key, result in list(classification_cache.items()):
+        content_hash = result.get("contentHash")
+        width, _, height = result.get("resolution", "").partition("x")
+        if not content_hash or content_hash not in embedding_store or not (width.isdigit() and height.isdigit()):
+            missing += 1
+            continue
+        keys.append(cache_key)
+        hashes.append(content_hash)
+        sizes.append((int(width), int(height)))
+    
+    if keys:
+        embeddings, _ = embedding_store.get_many(hashes)
+        classifications = classifier.classify_embeddings(embeddings, sizes)
+        
+        for cache_key, classification in zip(keys, classifications):
+            previous = classification_cache[cache_key]
+            for field in ("contentHash", "perceptualHash", "duplicateOf"):
+                classification[field] = previous.get(field)
+            result = {**previous, **classification_fields(classification)}
+            cache_put(cache_key, result)
+        save_cache()
+    
+    return {"reclassified": len(keys), "missingEmbeddings": missing}
+
+
+def is_supported(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in CONFIG["SUPPORTED_EXTENSIONS"]
+
+
+def remove_path(path: str):
+    """Drop a file's screenshot from the gallery, if it has one"""
+    existing = gallery.get_by_path(path)
+    if existing is not None:
+        gallery.remove(existing.id)
+
+
+def remove_tree(directory: str):
+    """Drop every screenshot under a directory that was deleted or moved away"""
+    gallery.remove_under(os.path.join(directory, ""))
+
+
+def ingest_files(paths: list):
+    """Classify files that have finished writing and update the gallery (ingest worker)"""
+    if classifier is None:
+        print(f"⚠️ Model not loaded; skipping {len(paths)} new file(s) until the next scan")
+        return
+    
+    with metrics.operation("ingest"):
+        results = classify_files(paths)
+    
+    for path, result in zip(paths, results):
+        if not result:
+            continue
+        
+        with gallery.lock:
+            existing = gallery.get_by_path(path)
+            if existing == result:
+                continue  # Touched but unchanged
+            
+            if result["isGameScreenshot"]:
+                ensure_thumbnails(result)
+                # An add or update, which reaches clients through the change broadcaster
+                gallery.add(result)
+        
+        if result["isGameScreenshot"]:
+            print(f"✅ GAME screenshot: {result['game']} ({result['confidence']:.1%} confidence)")
+        else:
+            reasons = []
+            if result.get("animeScore", 0) > 0.2:
+                reasons.append(f"anime={result['animeScore']:.1%}")
+            if result.get("codeScore", 0) > 0.2:
+                reasons.append(f"code={result['codeScore']:.1%}")
+            print(f"❌ Not a game ({', '.join(reasons) or 'low game score'}) - Skipping")
+            if existing is not None:
+                remove_path(path)
 
 
 # Watchdog event handler
 class ScreenshotHandler(FileSystemEventHandler):
+    """
+    Runs on the observer thread, so it only queues work; classification
+    happens on the ingest workers once each file has stopped changing
+    """
+    
+    def __init__(self, queue: IngestQueue):
+        super().__init__()
+        self.queue = queue
+    
     def on_created(self, event):
-        if event.is_directory:
-            return
-        
-        ext = os.path.splitext(event.src_path)[1].lower()
-        if ext not in CONFIG["SUPPORTED_EXTENSIONS"]:
+        if event.is_directory or not is_supported(event.src_path):
             return
         
         print(f"\n📷 New file detected: {os.path.basename(event.src_path)}")
+        self.queue.submit(event.src_path)
+    
+    def on_modified(self, event):
+        if event.is_directory or not is_supported(event.src_path):
+            return
         
-        # Wait for file to finish writing
-        time.sleep(2)
+        # Coalesced with any pending event for the same path
+        self.queue.submit(event.src_path)
+    
+    def on_moved(self, event):
+        if event.is_directory:
+            # A whole folder (say, one game's captures) was renamed or moved
+            print(f"📦 Folder moved: {event.src_path} → {event.dest_path}")
+            remove_tree(event.src_path)
+            for path in walk_roots([event.dest_path], is_supported, workers=CONFIG["SCAN_WORKERS"]):
+                self.queue.submit(path)
+            return
         
-        result = classify_file(event.src_path)
+        print(f"📦 File moved: {os.path.basename(event.src_path)} → {os.path.basename(event.dest_path)}")
+        self.queue.discard(event.src_path)
+        remove_path(event.src_path)
         
-        if result:
-            if result["isGameScreenshot"]:
-                print(f"✅ GAME screenshot: {result['game']} ({result['confidence']:.1%} confidence)")
-                game_screenshots.insert(0, result)
-                socketio.emit("newScreenshot", result)
-            else:
-                reasons = []
-                if result.get("animeScore", 0) > 0.2:
-                    reasons.append(f"anime={result['animeScore']:.1%}")
-                if result.get("codeScore", 0) > 0.2:
-                    reasons.append(f"code={result['codeScore']:.1%}")
-                print(f"❌ Not a game ({', '.join(reasons) or 'low game score'}) - Skipping")
+        if is_supported(event.dest_path):
+            self.queue.submit(event.dest_path)
     
     def on_deleted(self, event):
         if event.is_directory:
+            remove_tree(event.src_path)
             return
         
         filename = os.path.basename(event.src_path)
         print(f"🗑️ File removed: {filename}")
         
-        # Find and remove from list
-        global game_screenshots
-        for i, s in enumerate(game_screenshots):
-            if s["fileName"] == filename:
-                removed = game_screenshots.pop(i)
-                socketio.emit("removeScreenshot", {"id": removed["id"]})
-                break
+        self.queue.discard(event.src_path)
+        remove_path(event.src_path)
 
 
 # API Routes
-@app.route("/screenshots/<path:filename>")
-def serve_screenshot(filename):
-    """Serve screenshot files"""
-    return send_from_directory(CONFIG["SCREENSHOTS_FOLDER"], filename)
+def cached_json(version, build):
+    """
+    JSON response for this request's path and query, serialized (and
+    compressed) once per data version rather than on every request
+    build() returns (version, data), the version its data was read at
+    """
+    key = (request.path, tuple(sorted(request.args.items(multi=True))))
+    entry = response_cache.get(key, version)
+    if entry is None:
+        RESPONSE_CACHE_REQUESTS.inc(result="miss")
+        version, data = build()
+        entry = response_cache.put(key, version, app.json.dumps(data).encode())
+    else:
+        RESPONSE_CACHE_REQUESTS.inc(result="hit")
+    
+    if request.if_none_match.contains_weak(entry.etag):
+        RESPONSE_CACHE_REQUESTS.inc(result="not_modified")
+        response = app.response_class(status=304)
+    else:
+        encoding, body = response_cache.encode(key, entry, request.accept_encodings)
+        response = app.response_class(body, mimetype="application/json")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    
+    # Gzip and brotli bodies are the same JSON, so they share a weak ETag
+    response.set_etag(entry.etag, weak=True)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/screenshots/<screenshot_id>")
+def serve_screenshot(screenshot_id):
+    """
+    Serve a screenshot file by id, so only gallery files under the library roots are reachable
+    Supports Range requests and conditional GETs; ?v= matching the file's current version makes it immutable
+    """
+    screenshot = gallery.get(screenshot_id)
+    if screenshot is None:
+        return jsonify({"error": "Screenshot not found"}), 404
+    
+    path = screenshot["filePath"]
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return jsonify({"error": "Screenshot not found"}), 404
+    etag = file_version(path, stat.st_mtime_ns, stat.st_size)
+    
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+    else:
+        try:
+            # Handles Range/If-Range (206) itself; the body goes out through the server's file
+            # wrapper (sendfile on servers that support it) or as X-Sendfile when USE_X_SENDFILE is on
+            response = send_file(path, etag=etag, last_modified=stat.st_mtime, conditional=True)
+        except OSError:
+            return jsonify({"error": "Screenshot not found"}), 404
+    
+    # An old ?v= (the file was overwritten since) must not be cached under the new bytes
+    if request.args.get("v") == etag:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/thumbnails/<screenshot_id>")
+def serve_thumbnail(screenshot_id):
+    """Serve a cached thumbnail; ?w= picks the nearest pre-rendered width"""
+    screenshot = gallery.get(screenshot_id)
+    if screenshot is None:
+        return jsonify({"error": "Screenshot not found"}), 404
+    
+    key = thumbnail_key(screenshot)
+    width = thumbnail_service.snap_width(request.args.get("w", min(CONFIG["THUMBNAIL_WIDTHS"]), type=int))
+    etag = f"{key}-{width}"
+    
+    # Content-addressed, so a matching ETag means nothing to send
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        try:
+            path = thumbnail_service.get(screenshot["filePath"], key, width)
+        except Exception as e:
+            print(f"⚠️ Could not create thumbnail for {screenshot['fileName']}: {e}")
+            return jsonify({"error": "Thumbnail unavailable"}), 404
+        response = send_file(path, mimetype=thumbnail_service.mimetype, etag=etag, conditional=False)
+    
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
 
 
 @app.route("/api/screenshots")
 def get_screenshots():
-    """Get all game screenshots"""
+    """
+    Get game screenshots, newest first
+    ?limit=&cursor= paginate; ?fields=id,url,title projects each record
+    """
     category = request.args.get("category", "all")
+    collapse = request.args.get("collapse", "false").lower() in ("1", "true")
+    limit = request.args.get("limit", type=int)
+    cursor = request.args.get("cursor")
+    fields = [f for f in request.args.get("fields", "").split(",") if f]
+    
+    view = None if category == "all" else category
+    
+    before = None
+    if cursor:
+        try:
+            before = decode_cursor(cursor)
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid cursor"}), 400
+    if limit is not None:
+        limit = max(1, min(limit, 1000))
+    
+    def build():
+        with gallery.lock:
+            # Collapsed pages also depend on which embeddings are stored
+            version = derived_version() if collapse else gallery.version
+            # Read the sequence with the records: changes racing with this response get replayed, not lost
+            seq = change_seq
+            if collapse:
+                records = gallery.page(view)
+            else:
+                total = gallery.count(view)
+                # One extra record says whether there is a next page
+                page = gallery.page(view, before, limit + 1 if limit is not None else None)
+        
+        if collapse:
+            # Clustering works on the snapshot, so ingest isn't held up behind it
+            results = collapse_duplicates(records)
+            total = len(results)
+            start = find_position(results, before) if before else 0
+            page = results[start:start + limit + 1] if limit is not None else results[start:]
+        
+        next_cursor = None
+        if limit is not None and len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1])
+        
+        if fields:
+            page = [{f: s[f] for f in fields if f in s} for s in page]
+        else:
+            page = [s.to_dict() if isinstance(s, Screenshot) else s for s in page]
+        
+        return version, {
+            "total": total,
+            "screenshots": page,
+            "nextCursor": next_cursor,
+            "seq": seq,
+            "epoch": change_epoch
+        }
+    
+    return cached_json(derived_version() if collapse else gallery.version, build)
+
+
+@app.route("/api/screenshots/changes")
+def get_screenshot_changes():
+    """
+    Changes to the gallery since ?since=<seq>
+    Returns resync=true when the client must refetch /api/screenshots instead
+    """
+    since = request.args.get("since", 0, type=int)
+    epoch = request.args.get("epoch", change_epoch)
+    fields = [f for f in request.args.get("fields", "").split(",") if f]
+    
+    changes = changes_since(since) if epoch == change_epoch else None
+    if changes is None:
+        return jsonify({"resync": True, "seq": change_seq, "epoch": change_epoch})
+    
+    def change_payload(seq, op, screenshot):
+        payload = {"seq": seq, "op": op, "id": screenshot["id"]}
+        if op != "remove":
+            payload["screenshot"] = {f: screenshot[f] for f in fields if f in screenshot} if fields else screenshot.to_dict()
+        return payload
+    
+    return jsonify({
+        "resync": False,
+        "seq": changes[-1][0] if changes else since,
+        "epoch": change_epoch,
+        "changes": [change_payload(*change) for change in changes]
+    })
+
+
+@app.route("/api/search")
+def search_screenshots():
+    """Find screenshots matching a natural-language query"""
+    query = request.args.get("q", "").strip()
+    k = request.args.get("k", 50, type=int)
+    
+    if not query:
+        return jsonify({"error": "Missing query parameter 'q'"}), 400
+    if search_index is None:
+        return model_loading()
     
-    results = game_screenshots
-    if category != "all":
-        results = [s for s in game_screenshots if s["category"] == category]
+    rows, records = search_candidates()
+    hits = search_index.search(query, rows, max(1, min(k, 500)))
+    results = [{**records[row], "score": score} for row, score in hits]
     
     return jsonify({
         "total": len(results),
@@ -263,58 +1007,277 @@ def get_screenshots():
 
 @app.route("/api/categories")
 def get_categories():
-    """Get available categories"""
-    categories = list(set(s["category"] for s in game_screenshots))
-    return jsonify(categories)
+    """Get the categories that have screenshots"""
+    return cached_json(gallery.version, lambda: (gallery.version, sorted(gallery.category_counts())))
 
 
 @app.route("/api/stats")
 def get_stats():
-    """Get server stats"""
+    """
+    Get server stats
+    Not served from the response cache: ingest lag and the counters here change on every call
+    """
     return jsonify({
-        "totalScreenshots": len(game_screenshots),
-        "watchedFolder": CONFIG["SCREENSHOTS_FOLDER"],
-        "cacheSize": len(classification_cache)
+        "totalScreenshots": len(gallery),
+        "categories": gallery.category_counts(),
+        "watchedFolder": ", ".join(library_roots()),
+        "libraryRoots": library_roots(),
+        "cacheSize": len(classification_cache),
+        "inferenceBackend": CONFIG["INFERENCE_BACKEND"],
+        "ingest": ingest_queue.stats() if ingest_queue is not None else None,
+        "inferenceWorkers": classifier.backend.stats() if classifier is not None and classifier.workers else None,
+        "cascade": classifier.prefilter.report() if classifier is not None and classifier.prefilter else None,
+        "broadcast": broadcaster.stats(),
+        "responseCache": response_cache.stats()
     })
 
 
+@app.route("/api/health")
+def health():
+    """Liveness: the process is up and answering requests"""
+    return jsonify({"status": "ok", "uptimeSeconds": round(time.time() - started_at, 1), "pid": os.getpid()})
+
+
+@app.route("/api/ready")
+def ready():
+    """Readiness: 200 once the model is loaded and the startup scan has finished, 503 until then"""
+    is_ready = all(startup_status.values())
+    body = {"ready": is_ready, **startup_status, "totalScreenshots": len(gallery)}
+    if startup_job is not None and startup_job.status == "failed":
+        body["error"] = startup_job.error
+    return jsonify(body), 200 if is_ready else 503
+
+
+def ingest_depth():
+    if ingest_queue is None:
+        return None
+    stats = ingest_queue.stats()
+    return {("pending",): stats["pending"], ("ready",): stats["ready"], ("in_flight",): stats["inFlight"]}
+
+
+metrics.Gauge("screenshot_ingest_queue_depth", "Files waiting in the ingest queue", labels=("state",), function=ingest_depth)
+metrics.Gauge("screenshot_ingest_lag_seconds", "Age of the oldest file waiting to be ingested",
+              function=lambda: ingest_queue.stats()["lagSeconds"] if ingest_queue is not None else None)
+metrics.Gauge("screenshot_gallery_size", "Screenshots in the gallery", function=lambda: len(gallery))
+metrics.Gauge("screenshot_cache_entries", "Entries in the classification cache", function=lambda: len(classification_cache))
+metrics.Gauge("process_resident_memory_bytes", "Resident memory size in bytes", function=metrics.process_rss_bytes)
+metrics.Gauge("screenshot_response_cache_bytes", "Serialized API responses held in memory",
+              function=lambda: response_cache.stats()["bytes"])
+RESPONSE_CACHE_REQUESTS = metrics.Counter(
+    "screenshot_response_cache_requests_total",
+    "Cached API responses: hit/miss on the body, not_modified when the ETag matched",
+    labels=("result",)
+)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Counters, gauges and stage latency histograms in the Prometheus text format"""
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def model_loading():
+    return jsonify({"error": "The model is still loading", "ready": False}), 503
+
+
+def publish_job(job):
+    """Send a job's status and counters to every client"""
+    socketio.emit("jobProgress", job.to_dict())
+
+
+job_manager = JobManager(on_update=publish_job)
+
+
+def run_scan_job(job, full: bool = False, prepare=None) -> dict:
+    """Body of every scan job: optional preparation, the scan, then a refresh signal"""
+    extra = prepare() if prepare else {}
+    with metrics.operation("full_scan" if full else "scan"):
+        counters = scan_existing_files(job=job, full=full)
+    socketio.emit("refresh", {"seq": change_seq, "epoch": change_epoch})
+    return {"total": len(gallery), **counters, **extra}
+
+
 @app.route("/api/rescan", methods=["POST"])
 def rescan():
-    """Force rescan of screenshots folder"""
-    global game_screenshots
+    """Start a background rescan of the screenshots folder (only added/changed/removed files)"""
+    if classifier is None and (startup_job is None or not startup_job.active):
+        return model_loading()
+    
     print("\n🔄 Manual rescan triggered...")
-    game_screenshots = []
-    scan_existing_files()
-    socketio.emit("refresh")
-    return jsonify({"message": "Rescan complete", "total": len(game_screenshots)})
+    job, created = job_manager.start("scan", run_scan_job)
+    return jsonify({
+        "message": "Rescan started" if created else "Rescan already running",
+        "jobId": job.id,
+        "job": job.to_dict()
+    }), 202
 
 
 @app.route("/api/clear-cache", methods=["POST"])
 def clear_cache():
-    """Clear cache and rescan"""
-    global classification_cache, game_screenshots
-    print("\n🗑️ Clearing classification cache...")
-    classification_cache = {}
-    save_cache()
-    game_screenshots = []
-    scan_existing_files()
-    socketio.emit("refresh")
-    return jsonify({"message": "Cache cleared and rescanned", "total": len(game_screenshots)})
+    """Clear cache and rescan every file in the background"""
+    if classifier is None:
+        return model_loading()
+    
+    def prepare():
+        global classification_cache, duplicate_index, search_index
+        print("\n🗑️ Clearing classification cache and stored embeddings...")
+        classification_cache = {}
+        if cache_store is not None:
+            cache_store.clear()
+        
+        # Otherwise content-hash reuse would hand the old embeddings straight back and CLIP would never run
+        embedding_store.clear()
+        duplicate_index = build_duplicate_index()
+        classifier.duplicate_index = duplicate_index
+        search_index = SemanticSearch(
+            classifier,
+            embedding_store,
+            use_ann=CONFIG["SEARCH_ANN"],
+            ann_min_size=CONFIG["SEARCH_ANN_MIN_SIZE"]
+        )
+        gallery.touch()
+        return {}
+    
+    job, created = job_manager.start("scan", lambda job: run_scan_job(job, full=True, prepare=prepare))
+    if not created:
+        return jsonify({"error": "A scan is already running", "jobId": job.id}), 409
+    return jsonify({"message": "Clearing cache and rescanning", "jobId": job.id, "job": job.to_dict()}), 202
+
+
+@app.route("/api/reclassify", methods=["POST"])
+def reclassify():
+    """Re-run the prompts over stored embeddings and rebuild the gallery in the background"""
+    if classifier is None:
+        return model_loading()
+    
+    def prepare():
+        print("\n🧮 Reclassifying from stored embeddings...")
+        counts = reclassify_cache()
+        print(f"   Reclassified {counts['reclassified']} images ({counts['missingEmbeddings']} without embeddings)")
+        return counts
+    
+    # Every current file is then a cache hit, so the full scan doesn't need the model
+    job, created = job_manager.start("scan", lambda job: run_scan_job(job, full=True, prepare=prepare))
+    if not created:
+        return jsonify({"error": "A scan is already running", "jobId": job.id}), 409
+    return jsonify({"message": "Reclassifying from stored embeddings", "jobId": job.id, "job": job.to_dict()}), 202
+
+
+@app.route("/api/jobs")
+def list_jobs():
+    """Recent background jobs, newest first"""
+    with job_manager.lock:
+        jobs = [job.to_dict() for job in reversed(job_manager.jobs.values())]
+    return jsonify(jobs)
+
+
+@app.route("/api/jobs/<job_id>")
+def get_job(job_id):
+    """Status and progress counters of a background job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/api/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    """Request cancellation; the job stops at its next checkpoint without changing the gallery"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 202
 
 
 # Socket.IO events
 @socketio.on("connect")
 def handle_connect():
+    broadcaster.connect(request.sid)
     print(f"🔌 Client connected")
 
 
 @socketio.on("disconnect")
 def handle_disconnect():
+    broadcaster.disconnect(request.sid)
     print(f"🔌 Client disconnected")
 
 
+@socketio.on("changesAck")
+def handle_changes_ack(data):
+    """A client applied a screenshotsChanged batch"""
+    broadcaster.ack(request.sid, (data or {}).get("batch"))
+
+
+def load_model():
+    """Load CLIP and open the stores that depend on it"""
+    global classifier, embedding_store, search_index, duplicate_index
+    
+    # Imported here so torch and transformers don't hold up the server from listening
+    from classifier import GameScreenshotClassifier
+    
+    model = GameScreenshotClassifier(
+        decode_workers=CONFIG["DECODE_WORKERS"],
+        queue_size=CONFIG["DECODE_QUEUE_SIZE"],
+        backend=CONFIG["INFERENCE_BACKEND"],
+        threads=CONFIG["INFERENCE_THREADS"],
+        interop_threads=CONFIG["INFERENCE_INTEROP_THREADS"],
+        model_cache_dir=CONFIG["MODEL_CACHE_DIR"],
+        workers=CONFIG["INFERENCE_WORKERS"],
+        worker_batch_size=CONFIG["BATCH_SIZE"],
+        prefilter_cutoff=CONFIG["PREFILTER_CUTOFF"],
+        prefilter_audit_rate=CONFIG["PREFILTER_AUDIT_RATE"]
+    )
+    model.initialize()
+    
+    # Persist image embeddings so prompt/threshold changes only need /api/reclassify
+    embedding_store = EmbeddingStore(CONFIG["EMBEDDINGS_DIR"], model.embedding_dim)
+    model.embedding_store = embedding_store
+    duplicate_index = build_duplicate_index()
+    model.duplicate_index = duplicate_index
+    search_index = SemanticSearch(
+        model,
+        embedding_store,
+        use_ann=CONFIG["SEARCH_ANN"],
+        ann_min_size=CONFIG["SEARCH_ANN_MIN_SIZE"]
+    )
+    
+    # Last, so classifier is only set once everything it needs is in place
+    classifier = model
+    # Duplicate clusters (and the responses built on them) can use the embeddings now
+    gallery.touch()
+
+
+def run_startup(job) -> dict:
+    """Background half of startup: cached gallery first, then the model, then the reconciliation scan"""
+    job.counters = {"stage": "cache"}
+    job_manager.update(job)
+    load_cache()
+    restored = restore_gallery()
+    startup_status["cache"] = True
+    print(f"🖼️ Restored {restored} screenshots from cache")
+    socketio.emit("refresh", {"seq": change_seq, "epoch": change_epoch})
+    
+    job.counters = {"stage": "model"}
+    job_manager.update(job)
+    try:
+        load_model()
+        startup_status["model"] = True
+    finally:
+        # Files the watcher queued while the model was loading; held forever they would block the observer
+        if ingest_queue is not None:
+            ingest_queue.resume()
+    
+    result = run_scan_job(job)
+    startup_status["scan"] = True
+    print(f"✅ Ready in {time.time() - started_at:.1f}s\n")
+    return result
+
+
 def main():
-    global classifier
+    global thumbnail_service, ingest_queue, startup_job
+    
+    metrics.configure_timing_log(CONFIG["TIMING_LOG"])
+    metrics.configure_profiling(CONFIG["PROFILE_DIR"])
     
     print("""
 ╔════════════════════════════════════════════════════════════╗
@@ -326,25 +1289,37 @@ def main():
 ╚════════════════════════════════════════════════════════════╝
     """)
     
-    # Load cache
-    load_cache()
-    
-    # Initialize classifier
-    classifier = GameScreenshotClassifier()
-    classifier.initialize()
+    thumbnail_service = ThumbnailService(
+        CONFIG["THUMBNAIL_DIR"],
+        widths=CONFIG["THUMBNAIL_WIDTHS"],
+        image_format=CONFIG["THUMBNAIL_FORMAT"],
+        max_bytes=CONFIG["THUMBNAIL_CACHE_BYTES"],
+        workers=CONFIG["THUMBNAIL_WORKERS"]
+    )
     
-    # Scan existing files
-    scan_existing_files()
+    # Start the watcher right away; files are held in the queue until the model is ready
+    ingest_queue = IngestQueue(
+        ingest_files,
+        workers=CONFIG["INGEST_WORKERS"],
+        batch_size=CONFIG["BATCH_SIZE"],
+        max_pending=CONFIG["INGEST_MAX_PENDING"],
+        settle_seconds=CONFIG["INGEST_SETTLE_SECONDS"],
+        paused=True
+    )
+    ingest_queue.start()
+    broadcaster.start()
     
-    # Start file watcher
     observer = Observer()
-    observer.schedule(
-        ScreenshotHandler(),
-        CONFIG["SCREENSHOTS_FOLDER"],
-        recursive=False
-    )
+    handler = ScreenshotHandler(ingest_queue)
+    for root in library_roots():
+        if os.path.isdir(root):
+            observer.schedule(handler, root, recursive=True)
+            print(f"👀 Watching folder: {root}")
     observer.start()
-    print(f"👀 Watching folder: {CONFIG['SCREENSHOTS_FOLDER']}\n")
+    print()
+    
+    # Cache, model and scan load in the background; /api/ready reports when they're done
+    startup_job, _ = job_manager.start("scan", run_startup)
     
     # Start server
     print(f"🚀 Server running at http://localhost:{CONFIG['PORT']}\n")
@@ -0,0 +1,163 @@
+"""
+Thumbnail generation and caching
+Pre-renders each gallery image at a few fixed widths on a background pool
+and keeps them in a size-bounded LRU disk cache
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image
+
+
+class ThumbnailService:
+    """
+    Thumbnails are stored as <key>_<width>.<ext>, where key identifies the
+    file contents, so a cached thumbnail never goes stale and can be served
+    with a strong ETag and an immutable Cache-Control header
+    """
+
+    def __init__(self, cache_dir: str, widths: tuple = (320, 640), image_format: str = "webp",
+                 quality: int = 80, max_bytes: int = 2 * 1024 ** 3, workers: int = 2):
+        self.cache_dir = cache_dir
+        self.widths = tuple(sorted(widths))
+        self.image_format = image_format.lower()
+        self.extension = "jpg" if self.image_format == "jpeg" else self.image_format
+        self.mimetype = f"image/{self.image_format}"
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+        self.lock = threading.Lock()
+        self.in_flight = {}  # key -> Future of the render in progress, shared by submit() and get()
+
+        # filename -> size, least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Index thumbnails left by previous runs, oldest use first"""
+        found = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(found):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def snap_width(self, width: int) -> int:
+        """Smallest fixed width that covers the requested one"""
+        for candidate in self.widths:
+            if candidate >= width:
+                return candidate
+        return self.widths[-1]
+
+    def filename(self, key: str, width: int) -> str:
+        return f"{key}_{width}.{self.extension}"
+
+    def submit(self, source_path: str, key: str):
+        """Queue background generation unless every width is already cached"""
+        with self.lock:
+            if key in self.in_flight:
+                return
+            if all(self.filename(key, width) in self.entries for width in self.widths):
+                return
+            future = self.in_flight[key] = Future()
+        self.executor.submit(self._generate_logged, source_path, key, future)
+
+    def _generate_logged(self, source_path: str, key: str, future: Future):
+        try:
+            self._generate_into(source_path, key, future)
+        except Exception as e:
+            print(f"⚠️ Could not create thumbnails for {os.path.basename(source_path)}: {e}")
+
+    def _generate_into(self, source_path: str, key: str, future: Future):
+        """generate() on behalf of everyone waiting on future, which must be key's entry in in_flight"""
+        try:
+            self.generate(source_path, key)
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def generate(self, source_path: str, key: str):
+        """Render every fixed width from one decode of the source image"""
+        image = Image.open(source_path)
+        if image.format == "JPEG":
+            image.draft("RGB", (self.widths[-1], self.widths[-1]))
+        image.seek(0)
+        image = image.convert("RGB")
+
+        # Largest first, each width downscaled from the previous one
+        for width in reversed(self.widths):
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS, reducing_gap=2.0)
+            self._write(image, self.filename(key, width))
+
+        self._evict()
+
+    def _write(self, image: Image.Image, name: str):
+        path = os.path.join(self.cache_dir, name)
+        # Per writer, so concurrent renders of one key never rename each other's file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, format=self.image_format.upper(), quality=self.quality)
+        os.replace(tmp_path, path)
+
+        size = os.path.getsize(path)
+        with self.lock:
+            self.total_bytes += size - self.entries.pop(name, 0)
+            self.entries[name] = size
+
+    def _evict(self):
+        """Drop least recently used thumbnails until the cache fits in max_bytes"""
+        while True:
+            with self.lock:
+                if self.total_bytes <= self.max_bytes or not self.entries:
+                    return
+                name, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def get(self, source_path: str, key: str, width: int) -> str:
+        """Path of the cached thumbnail, rendering it now if it isn't cached yet"""
+        name = self.filename(key, self.snap_width(width))
+        path = os.path.join(self.cache_dir, name)
+
+        with self.lock:
+            cached = name in self.entries
+            if cached:
+                self.entries.move_to_end(name)
+
+        if cached:
+            # mtime doubles as the recency order across restarts
+            try:
+                os.utime(path)
+                return path
+            except OSError:
+                with self.lock:
+                    self.total_bytes -= self.entries.pop(name, 0)
+
+        # Wait for a render already under way (say, queued by submit()) rather than start a second one
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+        if owner:
+            self._generate_into(source_path, key, future)
+        else:
+            future.result()
+        return path
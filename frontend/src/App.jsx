@@ -22,9 +22,9 @@ function App() {
         loading, 
         error, 
         stats,
-        addScreenshot, 
-        removeScreenshot, 
-        refreshScreenshots 
+        applyChanges,
+        refreshScreenshots,
+        syncScreenshots
     } = useScreenshots()
     
     // Filter screenshots by category
@@ -44,6 +44,8 @@ function App() {
         newSocket.on('connect', () => {
             console.log('🔌 Connected to server')
             setConnected(true)
+            // Catch up on anything missed while disconnected
+            syncScreenshots()
         })
         
         newSocket.on('disconnect', () => {
@@ -51,19 +53,16 @@ function App() {
             setConnected(false)
         })
         
-        newSocket.on('newScreenshot', (screenshot) => {
-            console.log('📷 New screenshot received:', screenshot.title)
-            addScreenshot(screenshot)
+        newSocket.on('screenshotsChanged', async (batch) => {
+            console.log(`📷 ${batch.changes.length} screenshot change(s) received`)
+            await applyChanges(batch)
+            // Unacknowledged batches pile up for slow tabs; the server switches those to a resync
+            newSocket.emit('changesAck', { batch: batch.batch })
         })
         
-        newSocket.on('removeScreenshot', ({ id }) => {
-            console.log('🗑️ Screenshot removed:', id)
-            removeScreenshot(id)
-        })
-        
-        newSocket.on('refresh', () => {
+        newSocket.on('refresh', (target) => {
             console.log('🔄 Refresh signal received')
-            refreshScreenshots()
+            syncScreenshots(target || {})
         })
         
         setSocket(newSocket)
@@ -6,6 +6,11 @@ function ScreenshotCard({ screenshot, onClick, index }) {
     const [imageLoaded, setImageLoaded] = useState(false)
     const [imageError, setImageError] = useState(false)
     
+    // Grid cards only ever load thumbnails; the original is fetched by the Lightbox
+    const thumbnailSrcSet = screenshot.thumbnails
+        ? Object.entries(screenshot.thumbnails).map(([width, url]) => `${url} ${width}w`).join(', ')
+        : undefined
+    
     const confidenceColor = screenshot.confidence > 0.8 
         ? 'text-green-400' 
         : screenshot.confidence > 0.6 
@@ -38,7 +43,9 @@ function ScreenshotCard({ screenshot, onClick, index }) {
                     </div>
                 ) : (
                     <img
-                        src={screenshot.url}
+                        src={screenshot.thumbnailUrl || screenshot.url}
+                        srcSet={thumbnailSrcSet}
+                        sizes="(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw"
                         alt={screenshot.title}
                         className={`w-full h-full object-cover transition-all duration-500 ease-in-out group-hover:scale-105 ${
                             imageLoaded ? 'opacity-100' : 'opacity-0'
@@ -1,7 +1,13 @@
-import { useState, useEffect, useCallback } from 'react'
+import { useState, useEffect, useCallback, useRef } from 'react'
 
 const API_URL = 'http://localhost:3001'
 
+// Only what the grid and Lightbox render; skips scores and topPredictions
+const SCREENSHOT_FIELDS = [
+    'id', 'url', 'title', 'game', 'category', 'confidence',
+    'dateAdded', 'fileSize', 'thumbnailUrl', 'thumbnails'
+].join(',')
+
 export function useScreenshots() {
     const [screenshots, setScreenshots] = useState([])
     const [loading, setLoading] = useState(true)
@@ -12,25 +18,33 @@ export function useScreenshots() {
         cacheSize: 0
     })
     
+    // Position in the server changelog of the list we hold
+    const syncState = useRef({ seq: 0, epoch: null })
+    // True while a full fetch is under way; it will set syncState when it lands
+    const fetching = useRef(false)
+    
     // Fetch screenshots
     const fetchScreenshots = useCallback(async () => {
         try {
+            fetching.current = true
             setLoading(true)
             setError(null)
             
-            const response = await fetch(`${API_URL}/api/screenshots`)
+            const response = await fetch(`${API_URL}/api/screenshots?fields=${SCREENSHOT_FIELDS}`)
             
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`)
             }
             
             const data = await response.json()
+            syncState.current = { seq: data.seq, epoch: data.epoch }
             setScreenshots(data.screenshots)
             
         } catch (err) {
             console.error('Failed to fetch screenshots:', err)
             setError(err.message)
         } finally {
+            fetching.current = false
             setLoading(false)
         }
     }, [])
@@ -55,31 +69,24 @@ export function useScreenshots() {
         fetchStats()
     }, [fetchScreenshots, fetchStats])
     
-    // Add new screenshot (from socket)
-    const addScreenshot = useCallback((screenshot) => {
+    // Apply changelog entries ({ op, id, screenshot }) to the list in one render
+    const mergeChanges = useCallback((changes) => {
         setScreenshots(prev => {
-            // Check if already exists
-            if (prev.some(s => s.id === screenshot.id)) {
-                return prev
+            const byId = new Map(prev.map(s => [s.id, s]))
+            for (const change of changes) {
+                if (change.op === 'remove') {
+                    byId.delete(change.id)
+                } else {
+                    byId.set(change.id, change.screenshot)
+                }
             }
-            // Add to beginning (newest first)
-            return [screenshot, ...prev]
+            // Newest first, matching the server order
+            return [...byId.values()].sort((a, b) =>
+                a.dateAdded === b.dateAdded
+                    ? (a.id < b.id ? 1 : -1)
+                    : (a.dateAdded < b.dateAdded ? 1 : -1)
+            )
         })
-        
-        setStats(prev => ({
-            ...prev,
-            totalScreenshots: prev.totalScreenshots + 1
-        }))
-    }, [])
-    
-    // Remove screenshot (from socket)
-    const removeScreenshot = useCallback((id) => {
-        setScreenshots(prev => prev.filter(s => s.id !== id))
-        
-        setStats(prev => ({
-            ...prev,
-            totalScreenshots: Math.max(0, prev.totalScreenshots - 1)
-        }))
     }, [])
     
     // Refresh all screenshots
@@ -88,13 +95,73 @@ export function useScreenshots() {
         await fetchStats()
     }, [fetchScreenshots, fetchStats])
     
+    // Fetch only what changed since our last sync; falls back to a full refresh
+    const syncScreenshots = useCallback(async (target = {}) => {
+        const { seq, epoch } = syncState.current
+        
+        if (epoch === null && fetching.current) {
+            return  // The first fetch hasn't landed yet; it brings the current list
+        }
+        if (epoch === null || (target.epoch && target.epoch !== epoch)) {
+            return refreshScreenshots()
+        }
+        if (target.seq !== undefined && target.seq <= seq) {
+            return
+        }
+        
+        try {
+            const response = await fetch(
+                `${API_URL}/api/screenshots/changes?since=${seq}&epoch=${epoch}&fields=${SCREENSHOT_FIELDS}`
+            )
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`)
+            }
+            
+            const data = await response.json()
+            if (data.resync) {
+                return refreshScreenshots()
+            }
+            
+            syncState.current = { seq: Math.max(data.seq, syncState.current.seq), epoch: data.epoch }
+            if (data.changes.length === 0) {
+                return
+            }
+            
+            mergeChanges(data.changes)
+            await fetchStats()
+            
+        } catch (err) {
+            console.error('Failed to sync screenshots:', err)
+            await refreshScreenshots()
+        }
+    }, [refreshScreenshots, fetchStats, mergeChanges])
+    
+    // Apply a screenshotsChanged batch from the socket; falls back to syncing when it doesn't follow on
+    const applyChanges = useCallback(async (batch) => {
+        const { seq, epoch } = syncState.current
+        
+        if (batch.seq <= seq && batch.epoch === epoch) {
+            return  // Already covered by the list we hold
+        }
+        if (batch.truncated || batch.epoch !== epoch || batch.fromSeq > seq) {
+            return syncScreenshots({ seq: batch.seq, epoch: batch.epoch })
+        }
+        
+        // Each change is the latest state of its id, so overlap with what we hold is harmless
+        syncState.current = { seq: batch.seq, epoch }
+        if (batch.changes.length > 0) {
+            mergeChanges(batch.changes)
+            await fetchStats()
+        }
+    }, [syncScreenshots, mergeChanges, fetchStats])
+    
     return {
         screenshots,
         loading,
         error,
         stats,
-        addScreenshot,
-        removeScreenshot,
-        refreshScreenshots
+        applyChanges,
+        refreshScreenshots,
+        syncScreenshots
     }
 }
@@ -13,6 +13,10 @@ export default defineConfig({
       '/screenshots': {
         target: 'http://localhost:3001',
         changeOrigin: true
+      },
+      '/thumbnails': {
+        target: 'http://localhost:3001',
+        changeOrigin: true
       }
     }
   }